@@ -1,24 +1,155 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import firebase_admin
-from firebase_admin import auth as firebase_auth
+from starlette.concurrency import run_in_threadpool
 
-# Initialize Firebase Admin SDK (uses Application Default Credentials)
-if not firebase_admin._apps:
-    firebase_admin.initialize_app()
+from config import settings
+from services import membership, metrics
 
 security = HTTPBearer()
 
+_firebase_lock = threading.Lock()
+
+
+def firebase_auth():
+    """``firebase_admin.auth``, initialising the default app on first use.
+
+    Deferred so importing this module doesn't load the Firebase SDK; the
+    signing-key warmer normally gets here first, off the event loop.
+    """
+    import firebase_admin
+    from firebase_admin import auth
+
+    with _firebase_lock:
+        # Uses Application Default Credentials
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app()
+    return auth
+
+
+class TokenCache:
+    """LRU of decoded ID-token claims keyed by the token's SHA-256.
+
+    Entries expire at the token's own ``exp`` claim, so a cached token is
+    never honoured past the point Firebase would reject it. Only touched
+    from the event loop, so no locking.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, claims: dict) -> None:
+        exp = claims.get("exp")
+        if not exp:
+            return
+        key = self._key(token)
+        self._entries[key] = (claims, float(exp))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(settings.token_cache_size)
+
+
+# Where Firebase publishes the certs that sign ID tokens
+ID_TOKEN_CERT_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+
+
+def _cert_transport():
+    """The cache-control transport firebase_admin fetches signing certs with, or None.
+
+    firebase_admin has no public hook for this. The attributes below exist
+    in the releases requirements.txt allows, and warming is skipped rather
+    than failing if a later release moves them.
+    """
+    from google.auth.transport import Request as Transport
+
+    try:
+        transport = firebase_auth()._get_client(None)._token_verifier.request
+    except AttributeError:
+        return None
+    return transport if isinstance(transport, Transport) else None
+
+
+def warm_signing_keys() -> bool:
+    """Fetch Firebase's ID-token signing certs so the first verify doesn't pay for it.
+
+    Goes through the verifier's own transport, so later verifications are
+    served from the warmed HTTP cache. Returns False if that transport
+    can't be found.
+    """
+    transport = _cert_transport()
+    if transport is None:
+        return False
+    transport(url=ID_TOKEN_CERT_URL, method="GET")
+    return True
+
+
+def _verify_id_token(token: str) -> dict:
+    return firebase_auth().verify_id_token(token)
+
+
+async def keep_signing_keys_warm() -> None:
+    """Background task: refresh the signing certs off the event loop."""
+    while True:
+        try:
+            if not await run_in_threadpool(warm_signing_keys):
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(settings.signing_key_refresh_seconds)
+
 
 async def verify_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> dict:
     """Verify Firebase ID token and return decoded claims."""
-    try:
-        decoded = firebase_auth.verify_id_token(credentials.credentials)
+    token = credentials.credentials
+    start = time.perf_counter()
+    decoded = token_cache.get(token)
+    if decoded is not None:
+        metrics.observe(
+            metrics.token_verify_latency, time.perf_counter() - start, "hit", phase="auth"
+        )
         return decoded
+    try:
+        # RSA verification (and any cert fetch) is blocking; keep it off the loop
+        with metrics.timer(metrics.token_verify_latency, "miss", phase="auth"):
+            decoded = await run_in_threadpool(_verify_id_token, token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    token_cache.put(token, decoded)
+    return decoded
 
 
 async def get_current_user(claims: dict = Depends(verify_token)) -> dict:
@@ -28,3 +159,24 @@ async def get_current_user(claims: dict = Depends(verify_token)) -> dict:
         "email": claims.get("email"),
         "name": claims.get("name"),
     }
+
+
+async def require_member(band_id: str, user: dict = Depends(get_current_user)) -> dict:
+    """Current user, checked against the band's (cached) member list.
+
+    Use on any route with a ``{band_id}`` path parameter. Adds the member's
+    ``role`` to the returned user dict.
+    """
+    roles = await membership.get_roles(band_id)
+    if roles is None:
+        raise HTTPException(status_code=404, detail="Band not found")
+    role = roles.get(user["uid"])
+    if role is None:
+        raise HTTPException(status_code=403, detail="Not a member of this band")
+    return {**user, "role": role}
+
+
+async def require_admin(user: dict = Depends(require_member)) -> dict:
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Only band admins can do this")
+    return user
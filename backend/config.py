@@ -5,6 +5,85 @@ class Settings(BaseSettings):
     gcp_project_id: str = "lms-bandhub"
     cors_origins: str = "http://localhost:5173"
 
+    # Audio whose decoded 16-bit PCM would be at least this large (about 3
+    # minutes of 44.1 kHz stereo) is decoded by streaming PCM from ffmpeg
+    # instead of loading the whole file into memory
+    audio_stream_min_bytes: int = 32 * 1024 * 1024
+    # Loudness, true peak, tempo and key estimated alongside the peaks
+    audio_features_enabled: bool = True
+
+    # Background analysis: "process" (ProcessPoolExecutor) or "local" (in-process)
+    analysis_backend: str = "process"
+    # Each worker is a spawned Python process (~100 MB with NumPy loaded);
+    # one fits the 1 vCPU / 512Mi Cloud Run instance
+    analysis_workers: int = 1
+    analysis_queue_size: int = 32
+    # Start the analysis workers (and their NumPy/pydub imports) right after
+    # startup instead of on the first upload
+    analysis_prewarm: bool = True
+
+    # Requests that arrive while the API is still loading wait this long
+    # before getting a 503
+    startup_timeout_seconds: float = 30.0
+
+    # Verified ID tokens kept in memory (expire at the token's own exp)
+    token_cache_size: int = 4096
+    signing_key_refresh_seconds: int = 1800
+
+    # How long band membership/roles are trusted before re-reading the band doc
+    membership_cache_ttl_seconds: int = 30
+
+    # Rebuild a band's in-memory tag index (used only for multi-tag AND
+    # filters) after this long. It follows this instance's own writes; the
+    # rebuild is a full scan of the band's media, so it only exists to pick
+    # up docs written by the frontend or other instances. List results are
+    # re-checked against the docs either way.
+    tag_index_ttl_seconds: int = 600
+    # Per-band fingerprint index behind /media/{id}/similar, refreshed the
+    # same way
+    similarity_index_ttl_seconds: int = 600
+
+    # Server-Sent Events: per-topic replay history, per-client queue, keepalive
+    sse_history_size: int = 256
+    sse_queue_size: int = 64
+    sse_heartbeat_seconds: int = 15
+
+    # Counter shards per media doc for commentCount; 1 keeps it on the media doc
+    comment_count_shards: int = 1
+
+    # Rendered events.ics feeds are reused (and 304'd) for this long
+    ics_cache_ttl_seconds: int = 300
+
+    # Response compression: encodings in preference order (br/zstd are used
+    # only if their packages are installed) and the smallest body worth it
+    compression_enabled: bool = True
+    compression_encodings: str = "zstd,br,gzip"
+    compression_min_bytes: int = 1024
+
+    # Analysis results by upload SHA-256: local disk LRU (empty dir means a
+    # temp dir) and an optional Firestore tier shared across instances. The
+    # temp dir is RAM on Cloud Run, hence the small default cap
+    analysis_cache_dir: str = ""
+    analysis_cache_max_bytes: int = 32 * 1024 * 1024
+    analysis_cache_firestore: bool = False
+
+    # Preview transcodes for phone playback ("aac" or "opus"), kept in a
+    # local LRU directory (empty means a temp dir). On Cloud Run /tmp is
+    # RAM counted against the instance's 512Mi, so keep the cap small there
+    # or point the directory at a mounted volume before raising it
+    preview_enabled: bool = True
+    preview_codec: str = "aac"
+    preview_bitrate: str = "96k"
+    preview_cache_dir: str = ""
+    preview_cache_max_bytes: int = 64 * 1024 * 1024
+
+    # Request/Firestore/auth/analysis timings at /api/metrics and in
+    # Server-Timing headers. Off means no middleware and no client wrapper.
+    # If metrics_token is set, /api/metrics requires it as a bearer token.
+    metrics_enabled: bool = False
+    server_timing_enabled: bool = True
+    metrics_token: str = ""
+
     model_config = {"env_file": ".env", "extra": "ignore"}
 
 
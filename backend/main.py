@@ -1,14 +1,100 @@
-import os
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
 from config import settings
-from routers import bands, media, comments, calendar
+from middleware.compression import CompressionMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.startup import StartupGate
+from services import metrics
+from services.responses import FastJSONResponse
+from services.static_frontend import StaticFrontend
 
-app = FastAPI(title="LMS BandHub API", version="0.1.0")
+# Set once the routers are mounted; until then only these paths are served
+api_ready = asyncio.Event()
+ALWAYS_SERVED = frozenset({"/api/health"})
+
+static_dir = Path(__file__).parent / "static"
+
+
+def _load_api() -> tuple[list, StaticFrontend | None]:
+    """The API routers and everything behind them (Firebase, Firestore, NumPy),
+    plus the static frontend, which reads and hashes every built asset.
+
+    Slow enough to matter on a cold start, so it runs in a thread after the
+    server is already answering health checks.
+    """
+    from routers import bands, calendar, comments, media
+
+    routers = [bands.router, media.router, comments.router, calendar.router, calendar.feed_router]
+    frontend = StaticFrontend(static_dir) if static_dir.exists() else None
+    return routers, frontend
+
+
+async def _start_api(app: FastAPI, background: list[asyncio.Task]) -> None:
+    routers, frontend = await run_in_threadpool(_load_api)
+    for router in routers:
+        app.include_router(router)
+    # The SPA mount matches every path, so it has to come after the API routes
+    if frontend is not None:
+        app.mount("/", frontend, name="static")
+    api_ready.set()
+
+    from auth import keep_signing_keys_warm
+    from services.jobs import get_analysis_runner
+
+    background.append(asyncio.create_task(keep_signing_keys_warm()))
+    if settings.analysis_prewarm:
+        try:
+            await get_analysis_runner().warm()
+        except Exception:
+            # Only an optimisation; the first upload will load it instead
+            pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background: list[asyncio.Task] = []
+    loader = asyncio.create_task(_start_api(app, background))
+    app.state.api_loader = loader
+    yield
+    for task in [loader, *background]:
+        task.cancel()
+    await asyncio.gather(loader, *background, return_exceptions=True)
+    if api_ready.is_set():
+        from services.jobs import get_analysis_runner
+
+        await get_analysis_runner().shutdown()
+
+
+app = FastAPI(
+    title="LMS BandHub API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
+
+app.add_middleware(
+    StartupGate,
+    ready=api_ready,
+    exempt=ALWAYS_SERVED,
+    timeout=settings.startup_timeout_seconds,
+)
+
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_bytes,
+        encodings=[e.strip() for e in settings.compression_encodings.split(",") if e.strip()],
+    )
+
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware, server_timing=settings.server_timing_enabled)
 
 # CORS for local dev
 app.add_middleware(
@@ -17,21 +103,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
-# Register API routers
-app.include_router(bands.router)
-app.include_router(media.router)
-app.include_router(comments.router)
-app.include_router(calendar.router)
-
 
 @app.get("/api/health")
 async def health():
-    return {"status": "ok", "app": "LMS BandHub"}
+    loader = getattr(app.state, "api_loader", None)
+    if not api_ready.is_set() and loader is not None and loader.done():
+        # Routers failed to import; take this instance out of rotation
+        raise HTTPException(status_code=503, detail="API failed to load")
+    return {"status": "ok", "app": "LMS BandHub", "ready": api_ready.is_set()}
 
 
-# In production, serve the built frontend as static files
-static_dir = Path(__file__).parent / "static"
-if static_dir.exists():
-    app.mount("/", StaticFiles(directory=str(static_dir), html=True), name="static")
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics_endpoint(authorization: str | None = Header(None)):
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and authorization != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
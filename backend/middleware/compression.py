@@ -0,0 +1,214 @@
+"""Response compression: zstd, brotli or gzip, negotiated from Accept-Encoding.
+
+gzip always works (zlib); ``br`` needs the ``brotli`` package and ``zstd``
+the ``zstandard`` package, and are simply not offered when missing.
+Responses smaller than the threshold, already encoded, or of a type that
+doesn't compress (audio, images, octet-stream) pass through untouched.
+Streamed bodies (NDJSON export, SSE) are compressed chunk by chunk and
+flushed after every chunk so clients see each line as it is sent.
+"""
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "application/manifest+json",
+    "application/vnd.",
+    "image/svg+xml",
+)
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+def available_encodings() -> list[str]:
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def negotiate(accept_encoding: str, preferred: list[str]) -> str | None:
+    """Our most preferred encoding that the client accepts with q > 0."""
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in preferred:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        encodings: list[str] | None = None,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        available = available_encodings()
+        self.encodings = [e for e in (encodings or ["zstd", "br", "gzip"]) if e in available]
+        self.levels = {"gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level}
+
+    def _compressor(self, encoding: str):
+        cls = {"gzip": _Gzip, "br": _Brotli, "zstd": _Zstd}[encoding]
+        return cls(self.levels[encoding])
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self, encoding, send).run(scope, receive)
+
+
+class _CompressedResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.app = middleware.app
+        self.encoding = encoding
+        self.send = send
+        self.start: Message | None = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def run(self, scope: Scope, receive: Receive) -> None:
+        await self.app(scope, receive, self.on_send)
+
+    def _should_compress(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _encode_headers(self, message: Message) -> MutableHeaders:
+        headers = MutableHeaders(raw=message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        vary = headers.get("vary")
+        headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+        # The encoded bytes are a different representation; keep
+        # If-None-Match working but stop claiming byte-for-byte identity
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+        return headers
+
+    async def on_send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            status = message["status"]
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                status < 200 or status in (204, 206, 304) or not self._should_compress(headers)
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body:
+                # Whole body in one message: compress it (or not) in one go
+                if len(body) < self.middleware.minimum_size:
+                    await self.send(self.start)
+                    await self.send(message)
+                    return
+                compressor = self.middleware._compressor(self.encoding)
+                data = compressor.compress(body) + compressor.finish()
+                headers = self._encode_headers(self.start)
+                headers["Content-Length"] = str(len(data))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": data})
+                return
+
+            self.compressor = self.middleware._compressor(self.encoding)
+            headers = self._encode_headers(self.start)
+            del headers["Content-Length"]
+            await self.send(self.start)
+
+        if more_body:
+            data = self.compressor.compress(body) + self.compressor.flush()
+        else:
+            data = self.compressor.compress(body) + self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -0,0 +1,51 @@
+"""Per-route latency histograms and a Server-Timing header on every response."""
+
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services import metrics
+
+
+def _route(scope: Scope) -> str:
+    # Starlette records the matched route on the scope; label by its
+    # template so /media/{media_id} is one series, not one per id
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/api/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        timings = metrics.RequestTimings()
+        token = metrics.current.set(timings)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(raw=message["headers"])
+                    headers.append("Server-Timing", timings.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.current.reset(token)
+            route = _route(scope)
+            metrics.http_latency.observe(
+                time.perf_counter() - timings.start, scope["method"], route, f"{status // 100}xx"
+            )
+            for kind in ("read", "write"):
+                count = timings.phases.get(f"fs-{kind}", (0, 0.0))[0]
+                metrics.firestore_per_request.observe(count, route, kind)
@@ -0,0 +1,44 @@
+"""Holds requests until the API has finished loading in the background.
+
+``main`` starts serving with little more than the health check and imports
+the routers (and with them firebase_admin, Firestore and NumPy) once the
+server is up. Requests that arrive before then wait here rather than
+falling through to the SPA mount.
+"""
+
+import asyncio
+
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class StartupGate:
+    def __init__(
+        self,
+        app: ASGIApp,
+        ready: asyncio.Event,
+        exempt: frozenset[str] = frozenset(),
+        timeout: float = 30.0,
+    ):
+        self.app = app
+        self.ready = ready
+        self.exempt = exempt
+        self.timeout = timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] not in ("http", "websocket")
+            or self.ready.is_set()
+            or scope["path"] in self.exempt
+        ):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await asyncio.wait_for(self.ready.wait(), self.timeout)
+        except TimeoutError:
+            response = PlainTextResponse(
+                "Service is starting", status_code=503, headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -29,6 +31,23 @@ class ReplyCreate(BaseModel):
     text: str
 
 
+class ReplyImport(BaseModel):
+    text: str
+    author: str | None = None
+    createdAt: datetime | None = None
+
+
+class CommentImport(BaseModel):
+    """One comment in a bulk import; the same shape ``comments:export`` emits."""
+
+    timestamp: float
+    text: str
+    author: str | None = None
+    createdAt: datetime | None = None
+    resolved: bool = False
+    replies: list[ReplyImport] = []
+
+
 class EventCreate(BaseModel):
     title: str
     type: str = "other"
@@ -47,3 +66,6 @@ class UploadResponse(BaseModel):
     media_id: str
     name: str
     type: str
+    analysis_status: str | None = None
+    # Earlier media in the same band with identical content
+    duplicate_of: str | None = None
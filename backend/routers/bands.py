@@ -1,11 +1,13 @@
 import random
+import secrets
 import string
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from google.cloud.firestore import SERVER_TIMESTAMP
 
-from auth import get_current_user
+from auth import get_current_user, require_admin, require_member
 from models.schemas import BandCreate, BandJoin
-from services.firestore import get_db
+from services import calendar_feed, http_cache, membership
+from services.firestore import get_async_db
 
 router = APIRouter(prefix="/api/bands", tags=["bands"])
 
@@ -16,9 +18,9 @@ def _generate_invite_code() -> str:
 
 @router.post("")
 async def create_band(body: BandCreate, user: dict = Depends(get_current_user)):
-    db = get_db()
+    db = get_async_db()
     band_ref = db.collection("bands").document()
-    band_ref.set(
+    await band_ref.set(
         {
             "name": body.name,
             "createdBy": user["uid"],
@@ -33,32 +35,38 @@ async def create_band(body: BandCreate, user: dict = Depends(get_current_user)):
             },
         }
     )
+    membership.set_roles(band_ref.id, {user["uid"]: "admin"})
     return {"id": band_ref.id, "name": body.name}
 
 
 @router.get("/{band_id}")
-async def get_band(band_id: str, user: dict = Depends(get_current_user)):
-    db = get_db()
-    doc = db.collection("bands").document(band_id).get()
+async def get_band(
+    band_id: str,
+    request: Request,
+    response: Response,
+    user: dict = Depends(require_member),
+):
+    db = get_async_db()
+    doc = await db.collection("bands").document(band_id).get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Band not found")
-    data = doc.to_dict()
-    if user["uid"] not in data.get("members", {}):
-        raise HTTPException(status_code=403, detail="Not a member of this band")
-    return {"id": doc.id, **data}
+    cached = http_cache.not_modified(request, response, http_cache.make_etag(http_cache.stamp(doc)))
+    if cached is not None:
+        return cached
+    return {"id": doc.id, **doc.to_dict()}
 
 
 @router.post("/join")
 async def join_band(body: BandJoin, user: dict = Depends(get_current_user)):
-    db = get_db()
+    db = get_async_db()
     query = db.collection("bands").where("inviteCode", "==", body.invite_code.upper())
-    docs = list(query.stream())
+    docs = [d async for d in query.stream()]
     if not docs:
         raise HTTPException(status_code=404, detail="Invalid invite code")
 
     band_doc = docs[0]
     band_ref = db.collection("bands").document(band_doc.id)
-    band_ref.update(
+    await band_ref.update(
         {
             f"members.{user['uid']}": {
                 "role": "member",
@@ -67,20 +75,23 @@ async def join_band(body: BandJoin, user: dict = Depends(get_current_user)):
             }
         }
     )
+    membership.invalidate(band_doc.id)
     return {"id": band_doc.id, "name": band_doc.to_dict()["name"]}
 
 
 @router.post("/{band_id}/invite")
-async def refresh_invite(band_id: str, user: dict = Depends(get_current_user)):
-    db = get_db()
-    doc = db.collection("bands").document(band_id).get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Band not found")
-    data = doc.to_dict()
-    member = data.get("members", {}).get(user["uid"])
-    if not member or member.get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can refresh invite codes")
-
+async def refresh_invite(band_id: str, user: dict = Depends(require_admin)):
+    db = get_async_db()
     new_code = _generate_invite_code()
-    db.collection("bands").document(band_id).update({"inviteCode": new_code})
+    await db.collection("bands").document(band_id).update({"inviteCode": new_code})
     return {"invite_code": new_code}
+
+
+@router.post("/{band_id}/calendar-key")
+async def refresh_calendar_key(band_id: str, user: dict = Depends(require_admin)):
+    """Issue (or rotate) the key that authorises the band's events.ics feed."""
+    db = get_async_db()
+    key = secrets.token_urlsafe(24)
+    await db.collection("bands").document(band_id).update({"calendarKey": key})
+    calendar_feed.invalidate(band_id)
+    return {"calendar_key": key, "feed_path": f"/api/bands/{band_id}/events.ics?key={key}"}
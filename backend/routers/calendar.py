@@ -1,22 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from google.cloud.firestore import SERVER_TIMESTAMP
 
-from auth import get_current_user
+from auth import require_member
 from models.schemas import EventCreate, RSVPUpdate
-from services.firestore import get_db
+from services import calendar_feed, http_cache
+from services.firestore import get_async_db
+from services.pagination import decode_cursor, encode_cursor
+from services.responses import fast_json
 
 router = APIRouter(prefix="/api/bands/{band_id}/events", tags=["calendar"])
+# events.ics sits beside /events rather than under it
+feed_router = APIRouter(prefix="/api/bands/{band_id}", tags=["calendar"])
+
+MAX_PAGE_SIZE = 500
+# The ICS feed skips events that started longer ago than this
+ICS_HISTORY_DAYS = 180
+
+
+def _check_iso(value: str | None, name: str) -> None:
+    if value is None:
+        return
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be an ISO date or datetime")
 
 
 @router.post("")
 async def create_event(
     band_id: str,
     body: EventCreate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
+    db = get_async_db()
     ref = db.collection("bands").document(band_id).collection("events").document()
-    ref.set(
+    await ref.set(
         {
             "title": body.title,
             "type": body.type,
@@ -30,23 +51,84 @@ async def create_event(
             "createdAt": SERVER_TIMESTAMP,
         }
     )
+    calendar_feed.invalidate(band_id)
     return {"id": ref.id}
 
 
 @router.get("")
 async def list_events(
     band_id: str,
-    user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    from_: str | None = Query(None, alias="from"),
+    to: str | None = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    docs = (
-        db.collection("bands")
-        .document(band_id)
-        .collection("events")
-        .order_by("start")
-        .stream()
-    )
-    return [{"id": d.id, **d.to_dict()} for d in docs]
+    """Events with ``from <= start < to``, ordered by start.
+
+    ``start`` is stored as an ISO string, so the bounds compare as strings;
+    a bare date like ``2026-10-01`` covers that whole day. ``X-Next-Cursor``
+    is set when more events match.
+    """
+    _check_iso(from_, "from")
+    _check_iso(to, "to")
+    db = get_async_db()
+    query = db.collection("bands").document(band_id).collection("events")
+    if from_ is not None:
+        query = query.where("start", ">=", from_)
+    if to is not None:
+        query = query.where("start", "<", to)
+    query = query.order_by("start").order_by("__name__")
+    if cursor:
+        query = query.start_after(decode_cursor(cursor, "start"))
+
+    docs = [d async for d in query.limit(limit + 1).stream()]
+    events = [{"id": d.id, **d.to_dict()} for d in docs[:limit]]
+    if len(docs) > limit:
+        last = events[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["start"], last["id"])
+
+    etag = http_cache.make_etag(from_, to, limit, cursor, [http_cache.stamp(d) for d in docs])
+    cached = http_cache.not_modified(request, response, etag)
+    if cached is not None:
+        return cached
+    return fast_json(events, response)
+
+
+@feed_router.get("/events.ics")
+async def events_feed(
+    band_id: str,
+    key: str,
+    if_none_match: str | None = Header(None),
+):
+    """Subscribable iCalendar feed, authorised by the band's calendar key.
+
+    Calendar apps can't send Firebase tokens, so the feed URL carries the
+    key from ``POST /api/bands/{band_id}/calendar-key``.
+    """
+    feed = calendar_feed.get_feed(band_id)
+    if feed is None:
+        db = get_async_db()
+        band_ref = db.collection("bands").document(band_id)
+        band = await band_ref.get(field_paths=["name", "calendarKey"])
+        if not band.exists:
+            raise HTTPException(status_code=404, detail="Calendar not found")
+        data = band.to_dict() or {}
+        since = (datetime.now(timezone.utc) - timedelta(days=ICS_HISTORY_DAYS)).date().isoformat()
+        query = band_ref.collection("events").where("start", ">=", since).order_by("start")
+        events = [{"id": d.id, **d.to_dict()} async for d in query.stream()]
+        body = calendar_feed.render_ics(band_id, data.get("name") or "BandHub", events)
+        feed = calendar_feed.put_feed(band_id, data.get("calendarKey"), body)
+
+    if not feed.key or not secrets.compare_digest(feed.key.encode(), key.encode()):
+        raise HTTPException(status_code=404, detail="Calendar not found")
+
+    headers = {"ETag": feed.etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if if_none_match and http_cache.etag_matches(if_none_match, feed.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
 
 
 @router.patch("/{event_id}")
@@ -54,14 +136,14 @@ async def update_event(
     band_id: str,
     event_id: str,
     body: EventCreate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
+    db = get_async_db()
     ref = db.collection("bands").document(band_id).collection("events").document(event_id)
-    if not ref.get().exists:
+    if not (await ref.get()).exists:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    ref.update(
+    await ref.update(
         {
             "title": body.title,
             "type": body.type,
@@ -72,6 +154,7 @@ async def update_event(
             "linkedMedia": body.linked_media,
         }
     )
+    calendar_feed.invalidate(band_id)
     return {"ok": True}
 
 
@@ -80,12 +163,12 @@ async def rsvp_event(
     band_id: str,
     event_id: str,
     body: RSVPUpdate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
+    db = get_async_db()
     ref = db.collection("bands").document(band_id).collection("events").document(event_id)
-    if not ref.get().exists:
+    if not (await ref.get()).exists:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    ref.update({f"rsvp.{user['uid']}": body.status})
+    await ref.update({f"rsvp.{user['uid']}": body.status})
     return {"ok": True}
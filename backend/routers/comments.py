@@ -1,9 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from google.cloud.firestore import SERVER_TIMESTAMP, Increment
+import asyncio
+import json
+from datetime import datetime, timezone
 
-from auth import get_current_user
-from models.schemas import CommentCreate, CommentUpdate, ReplyCreate
-from services.firestore import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore import SERVER_TIMESTAMP, Increment, async_transactional
+
+from auth import require_member
+from config import settings
+from models.schemas import CommentCreate, CommentImport, CommentUpdate, ReplyCreate
+from services.counters import add_increment
+from services.events import format_sse, hub
+from services import http_cache
+from services.firestore import get_async_db
+from services.pagination import decode_cursor, encode_cursor
+from services.responses import dumps, fast_json
 
 router = APIRouter(
     prefix="/api/bands/{band_id}/media/{media_id}/comments",
@@ -11,56 +24,395 @@ router = APIRouter(
 )
 
 
+# Firestore's cap on writes in one batched commit
+MAX_BATCH_OPS = 500
+MAX_IMPORT_COMMENTS = 5000
+
+# Replies embedded per comment by ``include=replies``, and page size for /replies
+DEFAULT_REPLIES_LIMIT = 20
+MAX_REPLIES_LIMIT = 200
+
+
+def _media_ref(db, band_id: str, media_id: str):
+    return db.collection("bands").document(band_id).collection("media").document(media_id)
+
+
+def _topic(band_id: str, media_id: str) -> str:
+    return f"{band_id}/{media_id}"
+
+
+def _publish(band_id: str, media_id: str, event: str, data: dict) -> None:
+    hub.publish(_topic(band_id, media_id), event, data)
+
+
 @router.post("")
 async def create_comment(
     band_id: str,
     media_id: str,
     body: CommentCreate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
+    db = get_async_db()
+    media_ref = _media_ref(db, band_id, media_id)
+    comment_ref = media_ref.collection("comments").document()
+    comment = {
+        "timestamp": body.timestamp,
+        "text": body.text,
+        "author": user.get("name") or user.get("email") or "Unknown",
+        "authorUid": user["uid"],
+        "createdAt": SERVER_TIMESTAMP,
+        "resolved": False,
+        "replyCount": 0,
+    }
 
-    # Verify media exists
-    media_ref = db.collection("bands").document(band_id).collection("media").document(media_id)
-    if not media_ref.get().exists:
+    # Comment and count go out in one commit. The count update on the media
+    # doc fails the whole batch if the media doesn't exist, so no separate
+    # existence read is needed - except when a counter shard was picked.
+    batch = db.batch()
+    batch.set(comment_ref, comment)
+    if not add_increment(batch, media_ref, 1) and not (await media_ref.get()).exists:
+        raise HTTPException(status_code=404, detail="Media not found")
+    try:
+        await batch.commit()
+    except NotFound:
         raise HTTPException(status_code=404, detail="Media not found")
 
-    comment_ref = media_ref.collection("comments").document()
-    comment_ref.set(
-        {
-            "timestamp": body.timestamp,
-            "text": body.text,
-            "author": user.get("name") or user.get("email") or "Unknown",
-            "authorUid": user["uid"],
-            "createdAt": SERVER_TIMESTAMP,
-            "resolved": False,
-            "replyCount": 0,
-        }
+    _publish(
+        band_id,
+        media_id,
+        "comment.created",
+        {**comment, "id": comment_ref.id, "createdAt": datetime.now(timezone.utc).isoformat()},
     )
+    return {"id": comment_ref.id}
 
-    # Increment comment count on media doc
-    media_ref.update({"commentCount": Increment(1)})
 
-    return {"id": comment_ref.id}
+async def _collect(stream) -> list:
+    return [doc async for doc in stream]
+
+
+def _reply_key(reply: dict) -> tuple:
+    # SERVER_TIMESTAMP replies not yet resolved sort last
+    created = reply.get("createdAt")
+    return (created is None, created or datetime.min.replace(tzinfo=timezone.utc), reply["id"])
+
+
+async def _replies_by_comment(db, media_ref) -> tuple[dict[str, list[dict]], list[str]]:
+    """Every reply under ``media_ref`` in one collection-group query, grouped by comment id.
+
+    Also returns the replies' ``http_cache.stamp``s, in path order.
+    """
+    # Scope the "replies" group to this media's subtree by document path:
+    # everything under bands/b/media/m/ sorts between "m" and "m\0"
+    end = media_ref.parent.document(media_ref.id + "\0")
+    query = (
+        db.collection_group("replies")
+        .order_by("__name__")
+        .start_at({"__name__": media_ref})
+        .end_at({"__name__": end})
+    )
+    grouped: dict[str, list[dict]] = {}
+    stamps: list[str] = []
+    async for doc in query.stream():
+        stamps.append(f"{doc.reference.parent.parent.id}/{http_cache.stamp(doc)}")
+        # replies/{id} -> comments/{comment_id}
+        comment_id = doc.reference.parent.parent.id
+        grouped.setdefault(comment_id, []).append({"id": doc.id, **doc.to_dict()})
+    for replies in grouped.values():
+        replies.sort(key=_reply_key)
+    return grouped, stamps
 
 
 @router.get("")
 async def list_comments(
     band_id: str,
     media_id: str,
-    user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    include: str | None = Query(None, pattern="^replies$"),
+    replies_limit: int = Query(DEFAULT_REPLIES_LIMIT, ge=1, le=MAX_REPLIES_LIMIT),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    docs = (
-        db.collection("bands")
-        .document(band_id)
-        .collection("media")
-        .document(media_id)
+    """Top-level comments ordered by timestamp.
+
+    With ``include=replies`` each comment carries its first ``replies_limit``
+    replies (oldest first), fetched for the whole media item in a single
+    query. A comment with more has ``repliesNextCursor`` for
+    ``GET /{comment_id}/replies``.
+    """
+    db = get_async_db()
+    media_ref = _media_ref(db, band_id, media_id)
+    comments_query = media_ref.collection("comments").order_by("timestamp")
+
+    if include != "replies":
+        comments = await _collect(comments_query.stream())
+        etag = http_cache.make_etag([http_cache.stamp(d) for d in comments])
+        cached = http_cache.not_modified(request, response, etag)
+        if cached is not None:
+            return cached
+        return fast_json([{"id": d.id, **d.to_dict()} for d in comments], response)
+
+    comments, (grouped, reply_stamps) = await asyncio.gather(
+        _collect(comments_query.stream()),
+        _replies_by_comment(db, media_ref),
+    )
+    etag = http_cache.make_etag(
+        replies_limit, [http_cache.stamp(d) for d in comments], reply_stamps
+    )
+    cached = http_cache.not_modified(request, response, etag)
+    if cached is not None:
+        return cached
+
+    result = []
+    for doc in comments:
+        comment = {"id": doc.id, **doc.to_dict()}
+        replies = grouped.get(doc.id, [])
+        comment["replies"] = replies[:replies_limit]
+        if len(replies) > replies_limit:
+            last = comment["replies"][-1]
+            if isinstance(last.get("createdAt"), datetime):
+                comment["repliesNextCursor"] = encode_cursor(last["createdAt"], last["id"])
+        result.append(comment)
+    return fast_json(result, response)
+
+
+@router.get("/{comment_id}/replies")
+async def list_replies(
+    band_id: str,
+    media_id: str,
+    comment_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_REPLIES_LIMIT, ge=1, le=MAX_REPLIES_LIMIT),
+    cursor: str | None = None,
+    user: dict = Depends(require_member),
+):
+    """One comment's replies, oldest first. ``X-Next-Cursor`` is set if there are more."""
+    db = get_async_db()
+    query = (
+        _media_ref(db, band_id, media_id)
         .collection("comments")
-        .order_by("timestamp")
-        .stream()
+        .document(comment_id)
+        .collection("replies")
+        .order_by("createdAt")
+        .order_by("__name__")
+    )
+    if cursor:
+        query = query.start_after(decode_cursor(cursor, "createdAt"))
+    docs = await _collect(query.limit(limit + 1).stream())
+
+    replies = [{"id": d.id, **d.to_dict()} for d in docs[:limit]]
+    if len(docs) > limit:
+        last = replies[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["createdAt"], last["id"])
+    return fast_json(replies, response)
+
+
+async def _ndjson_lines(request: Request):
+    """Yield non-empty lines of an NDJSON body as it arrives."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def _validate_import(index: int, raw) -> CommentImport:
+    if index >= MAX_IMPORT_COMMENTS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_IMPORT_COMMENTS} comments per import"
+        )
+    try:
+        return CommentImport.model_validate(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail={"index": index, "errors": e.errors()})
+
+
+async def _import_items(request: Request):
+    """Validated comments from a JSON array or NDJSON body.
+
+    An array is validated in full before anything is yielded, so a bad item
+    rejects the whole import. NDJSON is validated line by line as it arrives.
+    """
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        index = 0
+        async for line in _ndjson_lines(request):
+            try:
+                raw = json.loads(line)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Malformed JSON in import body")
+            yield _validate_import(index, raw)
+            index += 1
+        return
+    try:
+        items = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed JSON in import body")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of comments")
+    for item in [_validate_import(i, raw) for i, raw in enumerate(items)]:
+        yield item
+
+
+@router.post(":batch")
+async def import_comments(
+    band_id: str,
+    media_id: str,
+    request: Request,
+    user: dict = Depends(require_member),
+):
+    """Bulk-create comments (and their replies) from a JSON array or NDJSON.
+
+    Writes go out in batched commits of up to 500 operations, with a single
+    ``commentCount`` update at the end for however many were written. A
+    JSON array is all or nothing as far as validation goes; an NDJSON
+    import that hits a bad line after committing some batches fails with
+    the committed ``ids`` in the error detail.
+    """
+    db = get_async_db()
+    media_ref = _media_ref(db, band_id, media_id)
+    if not (await media_ref.get()).exists:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    default_author = user.get("name") or user.get("email") or "Unknown"
+    batch = db.batch()
+    ops = 0
+    pending: list[str] = []
+    ids: list[str] = []
+
+    async def flush():
+        nonlocal batch, ops, pending
+        if ops:
+            await batch.commit()
+            ids.extend(pending)
+        batch, ops, pending = db.batch(), 0, []
+
+    try:
+        async for item in _import_items(request):
+            if ops + 1 + len(item.replies) > MAX_BATCH_OPS:
+                await flush()
+            comment_ref = media_ref.collection("comments").document()
+            batch.set(
+                comment_ref,
+                {
+                    "timestamp": item.timestamp,
+                    "text": item.text,
+                    "author": item.author or default_author,
+                    "authorUid": user["uid"],
+                    "createdAt": item.createdAt or SERVER_TIMESTAMP,
+                    "resolved": item.resolved,
+                    "replyCount": len(item.replies),
+                },
+            )
+            ops += 1
+            pending.append(comment_ref.id)
+            for reply in item.replies:
+                if ops >= MAX_BATCH_OPS:
+                    await flush()
+                batch.set(
+                    comment_ref.collection("replies").document(),
+                    {
+                        "text": reply.text,
+                        "author": reply.author or default_author,
+                        "authorUid": user["uid"],
+                        "createdAt": reply.createdAt or SERVER_TIMESTAMP,
+                    },
+                )
+                ops += 1
+        await flush()
+    except HTTPException as e:
+        if not ids:
+            raise
+        # A bad NDJSON line after some batches went out: say what was kept
+        raise HTTPException(
+            status_code=e.status_code,
+            detail={"error": e.detail, "imported": len(ids), "ids": ids},
+        ) from e
+    finally:
+        # Count whatever was committed, even if a later batch failed
+        if ids:
+            counter = db.batch()
+            add_increment(counter, media_ref, len(ids))
+            await counter.commit()
+            _publish(band_id, media_id, "comments.imported", {"count": len(ids)})
+
+    return {"imported": len(ids), "ids": ids}
+
+
+@router.get(":export")
+async def export_comments(
+    band_id: str,
+    media_id: str,
+    user: dict = Depends(require_member),
+):
+    """Stream every comment, with its replies embedded, as NDJSON.
+
+    Each line is a valid ``comments:batch`` item. Replies are only queried
+    for comments whose ``replyCount`` says they have any.
+    """
+    db = get_async_db()
+    media_ref = _media_ref(db, band_id, media_id)
+    if not (await media_ref.get()).exists:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    async def lines():
+        async for doc in media_ref.collection("comments").order_by("timestamp").stream():
+            comment = {"id": doc.id, **doc.to_dict(), "replies": []}
+            if comment.get("replyCount"):
+                replies = doc.reference.collection("replies").order_by("createdAt")
+                comment["replies"] = [{"id": r.id, **r.to_dict()} async for r in replies.stream()]
+            yield dumps(comment) + b"\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{media_id}-comments.ndjson"'},
+    )
+
+
+@router.get("/stream")
+async def stream_comments(
+    band_id: str,
+    media_id: str,
+    request: Request,
+    last_event_id: str | None = Header(None),
+    user: dict = Depends(require_member),
+):
+    """Server-Sent Events for comment and reply changes on one media item.
+
+    Events: ``comment.created``, ``comment.updated``, ``comment.deleted``,
+    ``reply.created``, and ``reset`` when ``Last-Event-ID`` can't be resumed
+    (re-read the list). A comment line is sent every
+    ``settings.sse_heartbeat_seconds`` to keep proxies from timing out.
+    """
+    sub = hub.subscribe(_topic(band_id, media_id), last_event_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        sub.get(), timeout=settings.sse_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                if message is None:
+                    break
+                yield format_sse(*message)
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return [{"id": d.id, **d.to_dict()} for d in docs]
 
 
 @router.patch("/{comment_id}")
@@ -69,18 +421,11 @@ async def update_comment(
     media_id: str,
     comment_id: str,
     body: CommentUpdate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    ref = (
-        db.collection("bands")
-        .document(band_id)
-        .collection("media")
-        .document(media_id)
-        .collection("comments")
-        .document(comment_id)
-    )
-    doc = ref.get()
+    db = get_async_db()
+    ref = _media_ref(db, band_id, media_id).collection("comments").document(comment_id)
+    doc = await ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Comment not found")
 
@@ -90,7 +435,8 @@ async def update_comment(
     if body.text is not None:
         updates["text"] = body.text
     if updates:
-        ref.update(updates)
+        await ref.update(updates)
+        _publish(band_id, media_id, "comment.updated", {"id": comment_id, **updates})
 
     return {"ok": True}
 
@@ -100,31 +446,27 @@ async def delete_comment(
     band_id: str,
     media_id: str,
     comment_id: str,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    ref = (
-        db.collection("bands")
-        .document(band_id)
-        .collection("media")
-        .document(media_id)
-        .collection("comments")
-        .document(comment_id)
-    )
-    doc = ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Comment not found")
-
-    data = doc.to_dict()
-    if data.get("authorUid") != user["uid"]:
-        raise HTTPException(status_code=403, detail="Can only delete your own comments")
+    db = get_async_db()
+    media_ref = _media_ref(db, band_id, media_id)
+    ref = media_ref.collection("comments").document(comment_id)
 
-    ref.delete()
+    # Read, author check, delete and decrement commit together, so the count
+    # can't drift if one of the writes fails
+    @async_transactional
+    async def delete(transaction):
+        doc = await ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Comment not found")
+        if doc.to_dict().get("authorUid") != user["uid"]:
+            raise HTTPException(status_code=403, detail="Can only delete your own comments")
+        transaction.delete(ref)
+        add_increment(transaction, media_ref, -1)
 
-    # Decrement comment count
-    media_ref = db.collection("bands").document(band_id).collection("media").document(media_id)
-    media_ref.update({"commentCount": Increment(-1)})
+    await delete(db.transaction())
 
+    _publish(band_id, media_id, "comment.deleted", {"id": comment_id})
     return {"ok": True}
 
 
@@ -134,30 +476,36 @@ async def add_reply(
     media_id: str,
     comment_id: str,
     body: ReplyCreate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    comment_ref = (
-        db.collection("bands")
-        .document(band_id)
-        .collection("media")
-        .document(media_id)
-        .collection("comments")
-        .document(comment_id)
-    )
-    if not comment_ref.get().exists:
+    db = get_async_db()
+    comment_ref = _media_ref(db, band_id, media_id).collection("comments").document(comment_id)
+    reply_ref = comment_ref.collection("replies").document()
+    reply = {
+        "text": body.text,
+        "author": user.get("name") or user.get("email") or "Unknown",
+        "authorUid": user["uid"],
+        "createdAt": SERVER_TIMESTAMP,
+    }
+
+    # The replyCount update doubles as the comment's existence check
+    batch = db.batch()
+    batch.set(reply_ref, reply)
+    batch.update(comment_ref, {"replyCount": Increment(1)})
+    try:
+        await batch.commit()
+    except NotFound:
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    reply_ref = comment_ref.collection("replies").document()
-    reply_ref.set(
+    _publish(
+        band_id,
+        media_id,
+        "reply.created",
         {
-            "text": body.text,
-            "author": user.get("name") or user.get("email") or "Unknown",
-            "authorUid": user["uid"],
-            "createdAt": SERVER_TIMESTAMP,
-        }
+            **reply,
+            "id": reply_ref.id,
+            "commentId": comment_id,
+            "createdAt": datetime.now(timezone.utc).isoformat(),
+        },
     )
-
-    comment_ref.update({"replyCount": Increment(1)})
-
     return {"id": reply_ref.id}
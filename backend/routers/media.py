@@ -1,11 +1,32 @@
+import base64
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import FileResponse
+from fastapi.routing import APIRoute
 from google.cloud.firestore import SERVER_TIMESTAMP
 
-from auth import get_current_user
+from auth import require_member
 from models.schemas import MediaUpdate, UploadResponse
-from services.firestore import get_db
-from services.audio import compute_peaks, get_duration
+from services.firestore import get_async_db
+from services.jobs import ANALYSIS_FIELDS, QueueFull, analysis_fields, get_analysis_runner
+from services.counters import shard_totals
+from services.peak_store import forget_pyramid, load_pyramid, store_pyramid
+from services.pagination import decode_cursor, encode_cursor
+from services.peaks import decode_peaks, encode_pairs, encode_peaks
+from services.responses import fast_json
+from services import analysis_cache, http_cache, previews, similarity, tag_index
+from services.uploads import spool_upload
 
 router = APIRouter(prefix="/api/bands/{band_id}/media", tags=["media"])
 
@@ -18,6 +39,32 @@ MIME_TYPE_MAP = {
 }
 
 
+# Fields fetched for list views; peaks and other derived data never leave Firestore
+LIST_FIELDS = [
+    "name",
+    "type",
+    "mimeType",
+    "size",
+    "duration",
+    "tags",
+    "project",
+    "uploadedBy",
+    "uploadedAt",
+    "commentCount",
+    "driveFileId",
+    "analysisStatus",
+    "duplicateOf",
+    "detectedBpm",
+    "detectedKey",
+]
+MAX_PAGE_SIZE = 200
+# Firestore's limit on values in an array-contains-any filter
+MAX_ANY_TAGS = 30
+
+# Clients that still want ``peaks`` as a JSON float list ask for this media type
+FLOAT_PEAKS_MEDIA_TYPE = "application/vnd.bandhub.media.v1+json"
+
+
 def _classify_type(mime_type: str) -> str:
     for category, prefixes in MIME_TYPE_MAP.items():
         if any(mime_type.startswith(p) for p in prefixes):
@@ -25,100 +72,469 @@ def _classify_type(mime_type: str) -> str:
     return "other"
 
 
-@router.post("/upload", response_model=UploadResponse)
+def _matches(
+    data: dict, wanted: list[str], match_all: bool, project: str | None, type: str | None
+) -> bool:
+    """Whether a fetched doc passes the list filters as it stands now."""
+    tags = set(data.get("tags") or [])
+    if wanted and not (set(wanted) <= tags if match_all else tags & set(wanted)):
+        return False
+    if project is not None and data.get("project") != project:
+        return False
+    return type is None or data.get("type") == type
+
+
+async def _find_duplicate(media_col, content_hash: str):
+    """An earlier upload of the same bytes in this band, if any."""
+    query = (
+        media_col.where("contentHash", "==", content_hash)
+        .select(ANALYSIS_FIELDS + ["analysisStatus", "peaks"])
+        .limit(1)
+    )
+    async for doc in query.stream():
+        return doc
+    return None
+
+
+async def _reuse_analysis(band_id: str, duplicate, content_hash: str):
+    """``(media fields, pyramid)`` from an identical earlier upload, or None.
+
+    The band's own duplicate is checked first, then the content-addressed
+    analysis cache.
+    """
+    if duplicate is not None:
+        data = duplicate.to_dict()
+        if data.get("analysisStatus") == "ready" and "duration" in data:
+            fields = {k: data[k] for k in ANALYSIS_FIELDS if k in data}
+            # Analysed before compact peaks: carry the float list over as a blob
+            if "peaksData" not in fields and data.get("peaks"):
+                fields["peaksData"] = encode_peaks(data["peaks"])
+            fields.update(analysisStatus="ready", analyzedAt=SERVER_TIMESTAMP)
+            return fields, await load_pyramid(band_id, duplicate.id)
+    analysis = await analysis_cache.get(content_hash)
+    if analysis is not None:
+        return analysis_fields(analysis), analysis.pyramid
+    return None
+
+
+async def _preview_then_cleanup(upload) -> None:
+    try:
+        await previews.build_preview(upload.sha256, upload.path)
+    finally:
+        upload.cleanup()
+
+
+def _queue_full() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Audio analysis queue is full, try again shortly",
+        headers={"Retry-After": "30"},
+    )
+
+
+class _UploadRoute(APIRoute):
+    """Refuses uploads while the analysis queue is full, before the body is read.
+
+    FastAPI parses (and spools) a multipart body before it runs any
+    dependency, so this has to happen in the route handler itself. The
+    file's type isn't known yet at this point, so every upload is refused.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            if get_analysis_runner().full():
+                raise _queue_full()
+            return await handler(request)
+
+        return route_handler
+
+
 async def upload_media(
     band_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
     """Legacy upload endpoint. Primary upload flow is now client-side via Google Drive API.
     This endpoint is kept for backwards compatibility / alternative upload paths."""
-    db = get_db()
-
-    # Verify band membership
-    band_doc = db.collection("bands").document(band_id).get()
-    if not band_doc.exists or user["uid"] not in band_doc.to_dict().get("members", {}):
-        raise HTTPException(status_code=403, detail="Not a member of this band")
+    db = get_async_db()
 
-    content = await file.read()
     mime_type = file.content_type or "application/octet-stream"
     file_type = _classify_type(mime_type)
     file_id = uuid.uuid4().hex
 
-    # Build media document (no file storage — frontend handles Drive upload)
-    media_data: dict = {
-        "name": file.filename,
-        "type": file_type,
-        "mimeType": mime_type,
-        "size": len(content),
-        "tags": [],
-        "uploadedBy": user["uid"],
-        "uploadedAt": SERVER_TIMESTAMP,
-        "commentCount": 0,
-    }
-
-    # Compute audio-specific metadata
-    if file_type == "audio":
-        media_data["duration"] = get_duration(content)
-        media_data["peaks"] = compute_peaks(content)
-
-    # Save to Firestore
-    media_ref = db.collection("bands").document(band_id).collection("media").document(file_id)
-    media_ref.set(media_data)
-
-    return UploadResponse(media_id=file_id, name=file.filename or "", type=file_type)
+    runner = get_analysis_runner()
+    # The queue may have filled while the body was being received
+    if file_type == "audio" and runner.full():
+        raise _queue_full()
+
+    upload = await spool_upload(file)
+    # Until the worker or the preview task takes the spooled file, any
+    # failure has to remove it: /tmp is RAM on Cloud Run
+    try:
+        media_col = db.collection("bands").document(band_id).collection("media")
+        duplicate = await _find_duplicate(media_col, upload.sha256)
+
+        # Build media document (no file storage — frontend handles Drive upload)
+        media_data: dict = {
+            "name": file.filename,
+            "type": file_type,
+            "mimeType": mime_type,
+            "size": upload.size,
+            "contentHash": upload.sha256,
+            "tags": [],
+            "uploadedBy": user["uid"],
+            "uploadedAt": SERVER_TIMESTAMP,
+            "commentCount": 0,
+        }
+        if duplicate is not None:
+            media_data["duplicateOf"] = duplicate.id
+
+        reused = None
+        if file_type == "audio":
+            reused = await _reuse_analysis(band_id, duplicate, upload.sha256)
+            if reused is not None:
+                media_data.update(reused[0])
+            else:
+                media_data["analysisStatus"] = "pending"
+
+        # Save to Firestore
+        media_ref = media_col.document(file_id)
+        await media_ref.set(media_data)
+        if reused is not None and reused[1] is not None:
+            await store_pyramid(band_id, file_id, reused[1])
+        tag_index.record_write(band_id, file_id, media_data)
+        similarity.record_write(band_id, file_id, media_data)
+
+        # Duration and peaks are patched in by the analysis worker, which takes
+        # ownership of the spooled file
+        analysis_status = media_data.get("analysisStatus")
+        if file_type == "audio" and reused is None:
+            try:
+                runner.submit(band_id, file_id, upload.path, upload.sha256)
+            except QueueFull:
+                upload.cleanup()
+                analysis_status = "failed"
+                await media_ref.update({"analysisStatus": analysis_status})
+        elif reused is not None:
+            # Analysis came from the cache, but this instance may still lack a preview
+            background_tasks.add_task(_preview_then_cleanup, upload)
+        else:
+            upload.cleanup()
+    except Exception:
+        upload.cleanup()
+        raise
+
+    return UploadResponse(
+        media_id=file_id,
+        name=file.filename or "",
+        type=file_type,
+        analysis_status=analysis_status,
+        duplicate_of=duplicate.id if duplicate is not None else None,
+    )
+
+
+router.add_api_route(
+    "/upload",
+    upload_media,
+    methods=["POST"],
+    response_model=UploadResponse,
+    route_class_override=_UploadRoute,
+)
 
 
 @router.get("")
 async def list_media(
     band_id: str,
+    request: Request,
+    response: Response,
     type: str | None = None,
     tag: str | None = None,
-    user: dict = Depends(get_current_user),
+    tags: str | None = None,
+    match: str = Query("all", pattern="^(all|any)$"),
+    project: str | None = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    query = db.collection("bands").document(band_id).collection("media")
-
-    if type:
-        query = query.where("type", "==", type)
+    """Newest-first page of media, without peaks.
+
+    ``tags`` is a comma-separated list matched with AND (``match=all``) or OR
+    (``match=any``); ``tag`` is the single-tag form. Pass the ``X-Next-Cursor``
+    response header back as ``cursor`` for the next page; it is absent on the
+    last page. ``fields`` is a comma-separated subset of ``LIST_FIELDS`` for
+    clients that need even less.
+    """
+    selected = LIST_FIELDS
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(selected) - set(LIST_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+
+    wanted = list(dict.fromkeys(t.strip() for t in (tags or "").split(",") if t.strip()))
+    if tag and tag not in wanted:
+        wanted.append(tag)
+    match_all = match == "all"
+    if not match_all and len(wanted) > MAX_ANY_TAGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_ANY_TAGS} tags with match=any")
+    after = decode_cursor(cursor, "uploadedAt") if cursor else None
+
+    db = get_async_db()
+    media_col = db.collection("bands").document(band_id).collection("media")
+    # uploadedAt is always fetched so the cursor can be built from the last
+    # doc; the filtered fields so every doc can be re-checked below
+    projection = sorted(set(selected) | {"uploadedAt", "tags", "project", "type"})
+
+    # Firestore allows one array-contains per query, so an AND over several
+    # tags is the one filter it can't answer; everything else is a query
+    multi_tag = match_all and len(wanted) > 1
+    index = tag_index.get_index(band_id) if multi_tag else None
+    if index is not None:
+        # Answered from the inverted index, then only the page's docs are
+        # read. The index can lag writes made elsewhere, so it only picks
+        # candidates; the docs themselves decide.
+        hits = index.match(wanted, match_all, project, type)
+        if after:
+            hits = [h for h in hits if h < (after["uploadedAt"], after["__name__"])]
+        page = [media_id for _, media_id in hits[:limit]]
+        snaps = {
+            d.id: d
+            async for d in db.get_all([media_col.document(m) for m in page], field_paths=projection)
+            if d.exists
+        }
+        docs = [snaps[m] for m in page if m in snaps]
+        has_more = len(hits) > limit
+    else:
+        query = media_col
+        if type:
+            query = query.where("type", "==", type)
+        if project:
+            query = query.where("project", "==", project)
+        if wanted and match_all:
+            # One array-contains per query; any further AND tags are checked below
+            query = query.where("tags", "array_contains", wanted[0])
+        elif wanted:
+            query = query.where("tags", "array_contains_any", wanted)
+
+        query = (
+            query.select(projection)
+            .order_by("uploadedAt", direction="DESCENDING")
+            .order_by("__name__", direction="DESCENDING")
+            .limit(limit)
+        )
+        if after:
+            query = query.start_after(after)
+        docs = [d async for d in query.stream()]
+        has_more = len(docs) == limit
+
+    extra_counts = {}
+    if "commentCount" in selected:
+        extra_counts = await shard_totals(db, [media_col.document(d.id) for d in docs])
 
-    docs = list(query.order_by("uploadedAt", direction="DESCENDING").stream())
     result = []
     for d in docs:
         data = d.to_dict()
-        if tag and tag not in data.get("tags", []):
+        if not _matches(data, wanted, match_all, project, type):
             continue
-        data["id"] = d.id
-        # Don't send peaks in list view (too large)
-        data.pop("peaks", None)
-        result.append(data)
+        item = {"id": d.id}
+        item.update((k, data[k]) for k in selected if k in data)
+        if d.id in extra_counts:
+            item["commentCount"] = item.get("commentCount", 0) + extra_counts[d.id]
+        result.append(item)
 
-    return result
+    if has_more and docs and docs[-1].get("uploadedAt") is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1].get("uploadedAt"), docs[-1].id)
+
+    etag = http_cache.make_etag(
+        str(request.query_params), [http_cache.stamp(d) for d in docs], sorted(extra_counts.items())
+    )
+    cached = http_cache.not_modified(request, response, etag)
+    if cached is not None:
+        return cached
+    return fast_json(result, response)
 
 
 @router.get("/{media_id}")
 async def get_media(
     band_id: str,
     media_id: str,
-    user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    doc = db.collection("bands").document(band_id).collection("media").document(media_id).get()
+    """Media doc with peaks as a base64 BHPK blob (``peaksData``).
+
+    Send ``Accept: application/vnd.bandhub.media.v1+json`` to get the old
+    ``peaks`` float list instead.
+    """
+    db = get_async_db()
+    media_ref = db.collection("bands").document(band_id).collection("media").document(media_id)
+    doc = await media_ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Media not found")
     data = doc.to_dict()
     data["id"] = doc.id
-    return data
+    extra = (await shard_totals(db, [doc.reference])).get(doc.id)
+    if extra:
+        data["commentCount"] = data.get("commentCount", 0) + extra
+
+    float_peaks = FLOAT_PEAKS_MEDIA_TYPE in request.headers.get("accept", "")
+    response.headers["Vary"] = "Accept"
+    etag = http_cache.make_etag(http_cache.stamp(doc), extra, float_peaks)
+    cached = http_cache.not_modified(request, response, etag)
+    if cached is not None:
+        return cached
+
+    # Only used server-side for /similar
+    data.pop("fingerprint", None)
+    # Docs written by the frontend (or before compact peaks) carry a float list
+    blob = data.pop("peaksData", None)
+    legacy = data.pop("peaks", None)
+    if float_peaks:
+        if blob is not None or legacy is not None:
+            data["peaks"] = decode_peaks(blob) if blob is not None else legacy
+    else:
+        if blob is None and legacy is not None:
+            blob = encode_peaks(legacy)
+        if blob is not None:
+            data["peaksData"] = base64.b64encode(blob).decode("ascii")
+    return fast_json(data, response)
+
+
+@router.get("/{media_id}/analysis")
+async def get_analysis_status(
+    band_id: str,
+    media_id: str,
+    user: dict = Depends(require_member),
+):
+    db = get_async_db()
+    media_ref = db.collection("bands").document(band_id).collection("media").document(media_id)
+    doc = await media_ref.get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Media not found")
+    data = doc.to_dict()
+
+    result = {"mediaId": doc.id, "status": data.get("analysisStatus", "ready")}
+    # The in-memory job record is fresher than the doc while a job is running
+    job = get_analysis_runner().status(media_id)
+    if job and job["bandId"] == band_id and result["status"] == "pending":
+        result["status"] = job["status"]
+        if "error" in job:
+            result["error"] = job["error"]
+    if result["status"] == "ready" and "duration" in data:
+        result["duration"] = data["duration"]
+    return result
+
+
+@router.get("/{media_id}/peaks")
+async def get_peaks(
+    band_id: str,
+    media_id: str,
+    request: Request,
+    start: float = Query(0.0, ge=0),
+    end: float | None = Query(None, gt=0),
+    width: int = Query(800, ge=1, le=8192),
+    user: dict = Depends(require_member),
+):
+    """Min/max peaks for ``width`` pixels spanning ``start``..``end`` seconds.
+
+    ``Accept: application/octet-stream`` returns the pairs as a BHPK blob with
+    the window's geometry in ``X-Peaks-*`` headers instead of JSON lists.
+    """
+    pyramid = await load_pyramid(band_id, media_id)
+    if pyramid is None:
+        raise HTTPException(status_code=404, detail="Peaks not available")
+
+    if end is None:
+        end = pyramid.duration
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    samples_per_pixel, pairs = pyramid.window(start, end, width)
+    if "application/octet-stream" in request.headers.get("accept", ""):
+        return Response(
+            content=encode_pairs(pairs),
+            media_type="application/octet-stream",
+            headers={
+                "X-Peaks-Sample-Rate": str(pyramid.sample_rate),
+                "X-Peaks-Samples-Per-Pixel": str(samples_per_pixel),
+                "X-Peaks-Start": str(start),
+                "X-Peaks-End": str(end),
+                "Vary": "Accept",
+            },
+        )
+    return {
+        "sampleRate": pyramid.sample_rate,
+        "duration": pyramid.duration,
+        "start": start,
+        "end": end,
+        "width": width,
+        "samplesPerPixel": samples_per_pixel,
+        "bits": 8,
+        "min": pairs[:, 0].tolist(),
+        "max": pairs[:, 1].tolist(),
+    }
+
+
+@router.get("/{media_id}/similar")
+async def get_similar(
+    band_id: str,
+    media_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    min_score: float = Query(0.0, ge=-1, le=1),
+    user: dict = Depends(require_member),
+):
+    """Other tracks in the band that sound most like this one, best first.
+
+    ``score`` is a -1..1 cosine similarity of chroma fingerprints, after
+    removing what the band's tracks have in common; takes of the same song
+    typically score well above unrelated ones. Answered from an in-memory
+    index, so only the first call per band waits on a Firestore scan.
+    """
+    index = await similarity.get_index(band_id)
+    if media_id not in index.vectors:
+        # Not indexed yet: missing, unanalysed, or written by another instance
+        ref = (
+            get_async_db()
+            .collection("bands")
+            .document(band_id)
+            .collection("media")
+            .document(media_id)
+        )
+        doc = await ref.get(field_paths=similarity.INDEX_FIELDS)
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="Media not found")
+        index.put(media_id, doc.to_dict() or {})
+        if media_id not in index.vectors:
+            raise HTTPException(status_code=404, detail="Fingerprint not available")
+
+    hits = index.nearest(media_id, limit, min_score)
+    return fast_json(
+        {
+            "mediaId": media_id,
+            "similar": [
+                {"id": hit_id, "name": index.names.get(hit_id), "score": round(score, 3)}
+                for hit_id, score in hits
+            ],
+        }
+    )
 
 
 @router.get("/{media_id}/audio-url")
 async def get_audio_url(
     band_id: str,
     media_id: str,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
-    doc = db.collection("bands").document(band_id).collection("media").document(media_id).get()
+    db = get_async_db()
+    media_ref = db.collection("bands").document(band_id).collection("media").document(media_id)
+    doc = await media_ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Media not found")
     data = doc.to_dict()
@@ -138,16 +554,50 @@ async def get_audio_url(
     raise HTTPException(status_code=404, detail="No file URL available")
 
 
+@router.get("/{media_id}/preview")
+async def get_preview(
+    band_id: str,
+    media_id: str,
+    if_none_match: str | None = Header(None),
+    user: dict = Depends(require_member),
+):
+    """Low-bitrate transcode for playback and scrubbing; supports ``Range``.
+
+    404 if this instance has no preview (not audio, transcode failed, or
+    evicted) - fall back to ``audio-url``.
+    """
+    db = get_async_db()
+    ref = db.collection("bands").document(band_id).collection("media").document(media_id)
+    doc = await ref.get(field_paths=["contentHash"])
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="Media not found")
+    content_hash = (doc.to_dict() or {}).get("contentHash")
+    path = await previews.preview_path(content_hash) if content_hash else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Preview not available")
+
+    suffix, media_type, _ = previews.preview_format()
+    # Content-addressed, so the ETag never changes for this media item
+    headers = {
+        "ETag": f'"{content_hash}{suffix}"',
+        "Cache-Control": "private, max-age=86400",
+    }
+    if if_none_match and http_cache.etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range / If-Range itself with 206 Partial Content
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
 @router.patch("/{media_id}")
 async def update_media(
     band_id: str,
     media_id: str,
     body: MediaUpdate,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
+    db = get_async_db()
     ref = db.collection("bands").document(band_id).collection("media").document(media_id)
-    doc = ref.get()
+    doc = await ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Media not found")
 
@@ -160,7 +610,9 @@ async def update_media(
         updates["project"] = body.project
 
     if updates:
-        ref.update(updates)
+        await ref.update(updates)
+        tag_index.record_write(band_id, media_id, updates)
+        similarity.record_write(band_id, media_id, updates)
 
     return {"ok": True}
 
@@ -169,16 +621,20 @@ async def update_media(
 async def delete_media(
     band_id: str,
     media_id: str,
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(require_member),
 ):
-    db = get_db()
+    db = get_async_db()
     ref = db.collection("bands").document(band_id).collection("media").document(media_id)
-    doc = ref.get()
+    doc = await ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Media not found")
 
     # Drive file deletion is handled by the frontend using the uploader's token.
-    # Backend only deletes the Firestore metadata doc.
-    ref.delete()
+    # Backend only deletes the Firestore metadata doc and derived data.
+    await ref.collection("derived").document("peaks").delete()
+    await ref.delete()
+    forget_pyramid(band_id, media_id)
+    tag_index.record_delete(band_id, media_id)
+    similarity.record_delete(band_id, media_id)
 
     return {"ok": True}
@@ -0,0 +1,121 @@
+"""Serialisation time and bytes on the wire for representative API payloads.
+
+Compares FastAPI's default path (``jsonable_encoder`` + ``JSONResponse``)
+with ``fast_json`` (orjson), then shows the encoded size for each
+compression encoding the middleware can offer here. Runs offline on
+synthetic payloads shaped like ``list_media`` and ``get_media`` responses:
+
+    python scripts/bench_responses.py --items 100 --repeat 200
+"""
+
+import argparse
+import base64
+import random
+import sys
+import time
+from datetime import timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from middleware.compression import CompressionMiddleware, available_encodings
+from services.peaks import encode_peaks
+from services.responses import fast_json
+
+TAGS = ["demo", "mix", "master", "live", "rehearsal", "vocals", "drums", "final"]
+
+
+def _timestamp(i: int) -> DatetimeWithNanoseconds:
+    base = DatetimeWithNanoseconds(2026, 1, 1, tzinfo=timezone.utc) + timedelta(hours=i)
+    return DatetimeWithNanoseconds(
+        base.year, base.month, base.day, base.hour, tzinfo=timezone.utc, nanosecond=i * 1000
+    )
+
+
+def list_media_payload(items: int) -> list[dict]:
+    rng = random.Random(1)
+    return [
+        {
+            "id": f"{i:020d}",
+            "name": f"Track {i} - take {rng.randint(1, 9)}.wav",
+            "type": "audio",
+            "mimeType": "audio/wav",
+            "size": rng.randint(1_000_000, 80_000_000),
+            "duration": rng.uniform(60, 420),
+            "uploadedBy": "uid-" + str(rng.randint(1, 5)),
+            "uploadedByName": "Band Member",
+            "uploadedAt": _timestamp(i),
+            "tags": rng.sample(TAGS, 3),
+            "project": "Album 2026",
+            "commentCount": rng.randint(0, 40),
+            "analysisStatus": "ready",
+        }
+        for i in range(items)
+    ]
+
+
+def get_media_payload(float_peaks: bool) -> dict:
+    doc = list_media_payload(1)[0]
+    peaks = np.abs(np.sin(np.linspace(0, 60, 2000))) * np.random.default_rng(1).random(2000)
+    if float_peaks:
+        doc["peaks"] = peaks.tolist()
+    else:
+        doc["peaksData"] = base64.b64encode(encode_peaks(peaks.tolist())).decode("ascii")
+    doc.update({"storagePath": "bands/b/media/x.wav", "sampleRate": 48000, "channels": 2})
+    return doc
+
+
+def _time(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def _encoded_sizes(body: bytes) -> dict[str, int]:
+    sizes = {"identity": len(body)}
+    middleware = CompressionMiddleware(app=None, minimum_size=0)
+    for encoding in available_encodings():
+        compressor = middleware._compressor(encoding)
+        sizes[encoding] = len(compressor.compress(body) + compressor.finish())
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100, help="list_media page size")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = {
+        f"list_media ({args.items} items)": list_media_payload(args.items),
+        "get_media (peaksData)": get_media_payload(float_peaks=False),
+        "get_media (float peaks)": get_media_payload(float_peaks=True),
+    }
+    for name, payload in payloads.items():
+        default_us = _time(lambda: JSONResponse(jsonable_encoder(payload)), args.repeat)
+        fast_us = _time(lambda: fast_json(payload), args.repeat)
+        body = fast_json(payload).body
+        print(name)
+        print(
+            f"  serialise  default {default_us:8.1f} us   orjson {fast_us:8.1f} us"
+            f"   ({default_us / fast_us:.1f}x)"
+        )
+        sizes = _encoded_sizes(body)
+        print(
+            "  bytes      "
+            + "   ".join(
+                f"{enc} {size:,}"
+                + ("" if enc == "identity" else f" ({size / sizes['identity']:.0%})")
+                for enc, size in sizes.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
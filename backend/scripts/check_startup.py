@@ -0,0 +1,157 @@
+"""Cold-start budget check: import time of ``main`` and time to first health check.
+
+Fails (exit status 1) if
+
+- ``python -X importtime -c "import main"`` takes longer than the import
+  budget, or pulls in any of ``DEFERRED_MODULES``, which are meant to load
+  in the background after startup; or
+- the median time from spawning ``uvicorn main:app`` to the first 200 from
+  ``/api/health`` is over the health budget.
+
+Run it from the backend directory, ideally in the production image, and
+before and after changes that add imports:
+
+    python scripts/check_startup.py --runs 5
+
+No Firebase credentials are needed; background loading failures don't
+affect the health check's timing. Needs ``httpx`` (not a runtime
+dependency of the API).
+"""
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+# Must not be imported by ``import main``
+DEFERRED_MODULES = [
+    "firebase_admin",
+    "google.cloud.firestore",
+    "numpy",
+    "pydub",
+    "auth",
+    "routers.media",
+]
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def _env() -> dict:
+    # A project id keeps google-auth from probing for one during import
+    return {"GOOGLE_CLOUD_PROJECT": "bandhub-startup-check", **os.environ}
+
+
+def measure_imports() -> tuple[float, list[tuple[float, str]], set[str]]:
+    """``(ms for main, [(cumulative ms, module)] slowest first, all module names)``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND,
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    main_ms = 0.0
+    modules: set[str] = set()
+    timings = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match is None:
+            continue
+        cumulative, indent, name = int(match[2]) / 1000, match[3], match[4]
+        modules.add(name)
+        if name == "main" and not indent:
+            main_ms = cumulative
+        timings.append((cumulative, name))
+    timings.sort(reverse=True)
+    return main_ms, timings, modules
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_health(timeout: float = 30.0) -> tuple[float, float | None]:
+    """``(ms to first healthy response, ms until the API reports ready)`` for one cold start."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=BACKEND,
+        env=_env(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    healthy = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                resp = httpx.get(url, timeout=1)
+            except httpx.TransportError:
+                time.sleep(0.005)
+                continue
+            now = (time.perf_counter() - start) * 1000
+            if resp.status_code == 200:
+                healthy = healthy or now
+                if resp.json().get("ready"):
+                    ready = now
+                    break
+            time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    if healthy is None:
+        raise RuntimeError(f"/api/health did not answer within {timeout:.0f}s")
+    return healthy, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--import-budget-ms", type=float, default=500)
+    parser.add_argument("--health-budget-ms", type=float, default=1500)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    failures = []
+    main_ms, timings, modules = measure_imports()
+    print(f"import main: {main_ms:.0f} ms (budget {args.import_budget_ms:.0f} ms)")
+    for cumulative, name in timings[: args.top]:
+        print(f"  {cumulative:7.1f} ms  {name}")
+    if main_ms > args.import_budget_ms:
+        failures.append(f"import main took {main_ms:.0f} ms")
+    eager = [m for m in DEFERRED_MODULES if m in modules]
+    if eager:
+        failures.append(f"imported at startup, should be deferred: {', '.join(eager)}")
+
+    runs = [measure_health() for _ in range(args.runs)]
+    healthy = statistics.median(r[0] for r in runs)
+    ready = [r[1] for r in runs if r[1] is not None]
+    print(
+        f"first /api/health: {healthy:.0f} ms median of {args.runs}"
+        f" (budget {args.health_budget_ms:.0f} ms)"
+    )
+    if ready:
+        print(f"API ready: {statistics.median(ready):.0f} ms median")
+    if healthy > args.health_budget_ms:
+        failures.append(f"first health check took {healthy:.0f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
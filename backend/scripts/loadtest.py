@@ -0,0 +1,76 @@
+"""Requests/sec against a running API backed by the Firebase emulators.
+
+Start the emulators and the API, then run this once per build you want to
+compare (e.g. before and after a change) with the same settings:
+
+    firebase emulators:start --only auth,firestore
+    FIRESTORE_EMULATOR_HOST=localhost:8080 FIREBASE_AUTH_EMULATOR_HOST=localhost:9099 \\
+        GOOGLE_CLOUD_PROJECT=lms-bandhub uvicorn main:app --port 8000 --workers 1
+    python scripts/loadtest.py --concurrency 50 --seconds 20
+
+Needs ``httpx`` (not a runtime dependency of the API).
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def _emulator_token(auth_host: str) -> str:
+    """Sign up a throwaway user on the Auth emulator and return its ID token."""
+    url = f"http://{auth_host}/identitytoolkit.googleapis.com/v1/accounts:signUp?key=fake"
+    async with httpx.AsyncClient() as client:
+        resp = await client.post(url, json={"returnSecureToken": True})
+        resp.raise_for_status()
+        return resp.json()["idToken"]
+
+
+async def _worker(client: httpx.AsyncClient, paths: list[str], deadline: float, latencies: list):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        resp = await client.get(path)
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(args) -> None:
+    token = await _emulator_token(args.auth_host)
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, limits=limits) as client:
+        resp = await client.post("/api/bands", json={"name": "Load Test"})
+        resp.raise_for_status()
+        band_id = resp.json()["id"]
+        paths = [
+            f"/api/bands/{band_id}",
+            f"/api/bands/{band_id}/media",
+            f"/api/bands/{band_id}/events",
+        ]
+
+        latencies: list[float] = []
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            *(_worker(client, paths, deadline, latencies) for _ in range(args.concurrency))
+        )
+
+    latencies.sort()
+    count = len(latencies)
+    print(f"requests: {count}")
+    print(f"req/s:    {count / args.seconds:.1f}")
+    if count:
+        print(f"p50 ms:   {latencies[count // 2] * 1000:.1f}")
+        print(f"p99 ms:   {latencies[int(count * 0.99)] * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--auth-host", default="localhost:9099")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=20)
+    asyncio.run(main(parser.parse_args()))
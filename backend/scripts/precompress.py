@@ -0,0 +1,52 @@
+"""Write .br / .gz siblings next to compressible files in the built frontend.
+
+Run after ``npm run build`` (the Dockerfile does this) so the static
+server never has to compress at request time:
+
+    python scripts/precompress.py static
+
+Without the ``brotli`` package only ``.gz`` files are written.
+"""
+
+import argparse
+import mimetypes
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from middleware.compression import COMPRESSIBLE_TYPES
+from services.static_frontend import (
+    MIN_COMPRESS_BYTES,
+    MIN_SAVING,
+    SUFFIXES,
+    compress,
+    supported_encodings,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", type=Path)
+    args = parser.parse_args()
+
+    total = written = 0
+    for path in sorted(args.directory.rglob("*")):
+        if not path.is_file() or path.suffix in SUFFIXES.values():
+            continue
+        media_type = mimetypes.guess_type(path.name)[0] or ""
+        data = path.read_bytes()
+        if len(data) < MIN_COMPRESS_BYTES or not media_type.startswith(COMPRESSIBLE_TYPES):
+            continue
+        for encoding in supported_encodings():
+            encoded = compress(data, encoding)
+            if len(encoded) < len(data) * MIN_SAVING:
+                path.with_name(path.name + SUFFIXES[encoding]).write_bytes(encoded)
+                total += len(data)
+                written += len(encoded)
+    if total:
+        print(f"precompressed {total:,} -> {written:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Content-addressed cache of audio analysis results, keyed by upload SHA-256.
+
+Two tiers:
+
+- a local on-disk LRU (``settings.analysis_cache_dir``) capped at
+  ``settings.analysis_cache_max_bytes``, evicting least recently used
+  entries by mtime;
+- optionally (``settings.analysis_cache_firestore``) an ``analysisCache``
+  collection shared by every instance, so a scaled-to-zero service doesn't
+  forget what it has already analysed.
+
+Entries are the serialised ``AudioAnalysis``: scalar fields as JSON, peaks
+as float32 and the pyramid in its own BHPY format.
+"""
+
+import dataclasses
+import json
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from services.audio import AudioAnalysis
+from services.disk_lru import DiskLRU
+from services.firestore import get_async_db
+from services.peaks import PeakPyramid
+
+MAGIC = b"BHAC"
+# Bumped when AudioAnalysis gains fields, so older entries are recomputed
+VERSION = 3
+# magic, version, meta JSON length, peaks count
+_HEADER = struct.Struct("<4sBII")
+FIRESTORE_COLLECTION = "analysisCache"
+# Leave room under Firestore's 1 MiB document limit
+MAX_FIRESTORE_BYTES = 1_000_000
+
+
+def to_bytes(analysis: AudioAnalysis) -> bytes:
+    meta = {
+        f.name: getattr(analysis, f.name)
+        for f in dataclasses.fields(analysis)
+        if f.name not in ("peaks", "pyramid")
+    }
+    meta_bytes = json.dumps(meta).encode()
+    peaks = np.asarray(analysis.peaks, dtype="<f4")
+    pyramid = analysis.pyramid.to_bytes() if analysis.pyramid is not None else b""
+    header = _HEADER.pack(MAGIC, VERSION, len(meta_bytes), len(peaks))
+    return b"".join([header, meta_bytes, peaks.tobytes(), pyramid])
+
+
+def from_bytes(blob: bytes) -> AudioAnalysis:
+    magic, version, meta_len, peak_count = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Unsupported analysis cache entry")
+    offset = _HEADER.size
+    meta = json.loads(blob[offset : offset + meta_len])
+    offset += meta_len
+    peaks = np.frombuffer(blob, dtype="<f4", count=peak_count, offset=offset)
+    offset += peak_count * 4
+    known = {f.name for f in dataclasses.fields(AudioAnalysis)}
+    return AudioAnalysis(
+        **{k: v for k, v in meta.items() if k in known},
+        peaks=peaks.astype(float).tolist(),
+        pyramid=PeakPyramid.from_bytes(blob[offset:]) if offset < len(blob) else None,
+    )
+
+
+_disk = DiskLRU(
+    settings.analysis_cache_dir or Path(tempfile.gettempdir()) / "bandhub-analysis-cache",
+    settings.analysis_cache_max_bytes,
+)
+
+
+def _firestore_ref(content_hash: str):
+    return get_async_db().collection(FIRESTORE_COLLECTION).document(content_hash)
+
+
+async def get(content_hash: str) -> AudioAnalysis | None:
+    """Cached analysis for this content, checking disk then (if enabled) Firestore."""
+    blob = await run_in_threadpool(_disk.get, content_hash)
+    if blob is None and settings.analysis_cache_firestore:
+        doc = await _firestore_ref(content_hash).get()
+        if doc.exists:
+            blob = doc.to_dict().get("blob")
+            if blob:
+                await run_in_threadpool(_disk.put, content_hash, blob)
+    if not blob:
+        return None
+    try:
+        return from_bytes(blob)
+    except (ValueError, struct.error):
+        return None
+
+
+async def put(content_hash: str, analysis: AudioAnalysis) -> None:
+    blob = to_bytes(analysis)
+    await run_in_threadpool(_disk.put, content_hash, blob)
+    if settings.analysis_cache_firestore and len(blob) <= MAX_FIRESTORE_BYTES:
+        await _firestore_ref(content_hash).set({"blob": blob})
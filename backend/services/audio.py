@@ -1,61 +1,391 @@
-"""Audio processing service - peak computation for waveform rendering."""
+"""Audio processing service - peak computation for waveform rendering,
+plus the loudness/tempo/key features from ``services.features``."""
 
 import io
-import struct
+import json
+import subprocess
+from dataclasses import dataclass, field
+
 import numpy as np
 
+from config import settings
+from services.features import FeatureExtractor
+from services.peaks import MAX_BASE_PIXELS, PeakPyramid, base_samples_per_pixel
 
-def compute_peaks(audio_data: bytes, num_peaks: int = 800) -> list[float]:
-    """Compute waveform peaks from raw audio data.
+NUM_PEAKS = 800
 
-    Adapted from FlightRecordingAnalyzer's _compute_peaks pattern.
-    Takes raw audio bytes, decodes to samples, and computes
-    downsampled peak values for waveform visualization.
+# Bytes per sample of the 16-bit PCM the in-memory path decodes to
+PCM_SAMPLE_BYTES = 2
+
+# Frames per read from ffmpeg's stdout in streaming mode (~1.5 MB of stereo f32)
+STREAM_BLOCK_FRAMES = 1 << 16
+
+
+@dataclass
+class AudioAnalysis:
+    """Everything we derive from a single decode of an audio file."""
+
+    duration: float = 0.0
+    sample_rate: int = 0
+    channels: int = 0
+    frames: int = 0
+    peaks: list[float] = field(default_factory=lambda: [0.0] * NUM_PEAKS)
+    pyramid: PeakPyramid | None = None
+    # Estimated features; None when disabled or not measurable
+    loudness: float | None = None
+    true_peak: float | None = None
+    bpm: float | None = None
+    key: str | None = None
+    key_confidence: float | None = None
+    fingerprint: list[float] | None = None
+
+
+def _extractor(sample_rate: int, channels: int) -> FeatureExtractor | None:
+    if not settings.audio_features_enabled or not sample_rate or not channels:
+        return None
+    return FeatureExtractor(sample_rate, channels)
+
+
+def _features(extractor: FeatureExtractor | None) -> dict:
+    if extractor is None:
+        return {}
+    return extractor.result()
+
+
+def warm_audio_stack() -> None:
+    """Import the decoder now so this process's first analysis doesn't pay for it."""
+    import pydub  # noqa: F401
+
+
+def _decode(source: bytes | str):
+    from pydub import AudioSegment
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return AudioSegment.from_file(source)
+
+
+def _mono_samples(audio) -> np.ndarray:
+    """Return the segment's samples as a 1-D mono array in their native int dtype."""
+    samples = np.array(audio.get_array_of_samples())
+    if audio.channels > 1:
+        frames = len(samples) // audio.channels
+        samples = samples[: frames * audio.channels].reshape(frames, audio.channels)
+        samples = samples.mean(axis=1)
+    return samples
+
+
+def reduce_peaks(samples: np.ndarray, num_peaks: int = NUM_PEAKS) -> list[float]:
+    """Downsample mono samples to ``num_peaks`` normalized absolute peaks.
+
+    Uses the same bucketing as the original per-chunk loop (``len // num_peaks``
+    samples per bucket, trailing remainder dropped, zero padded when the input
+    is shorter than ``num_peaks``) but does the reduction in one reshape.
     """
-    try:
-        from pydub import AudioSegment
+    n = len(samples)
+    if n == 0:
+        return [0.0] * num_peaks
 
-        audio = AudioSegment.from_file(io.BytesIO(audio_data))
-        # Convert to mono
-        if audio.channels > 1:
-            audio = audio.set_channels(1)
+    chunk_size = max(1, n // num_peaks)
+    buckets = min(num_peaks, n // chunk_size)
+    block = samples[: buckets * chunk_size].reshape(buckets, chunk_size)
 
-        samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    # Reduce min and max in the native dtype, then widen before negating so
+    # int16 -32768 never overflows
+    peaks = np.maximum(
+        block.max(axis=1).astype(np.float64), -block.min(axis=1).astype(np.float64)
+    )
+    return _normalize(peaks, _abs_max(samples), num_peaks)
 
-        if len(samples) == 0:
-            return [0.0] * num_peaks
 
-        # Normalize to -1..1
-        max_val = np.max(np.abs(samples))
-        if max_val > 0:
-            samples = samples / max_val
+def _abs_max(samples: np.ndarray) -> float:
+    return max(float(samples.max()), -float(samples.min()))
 
-        # Downsample to target number of peaks
-        chunk_size = max(1, len(samples) // num_peaks)
-        peaks = []
-        for i in range(0, len(samples), chunk_size):
-            chunk = samples[i : i + chunk_size]
-            peaks.append(float(np.max(np.abs(chunk))))
 
-        # Trim or pad to exact count
-        if len(peaks) > num_peaks:
-            peaks = peaks[:num_peaks]
-        while len(peaks) < num_peaks:
-            peaks.append(0.0)
+def _normalize(peaks: np.ndarray, max_val: float, num_peaks: int) -> list[float]:
+    if max_val > 0:
+        peaks = peaks / max_val
+    out = np.zeros(num_peaks)
+    out[: len(peaks)] = peaks[:num_peaks]
+    return out.tolist()
 
-        return peaks
 
-    except Exception:
-        # Return flat line on error
+class BucketReducer:
+    """Incremental per-bucket min/max over a stream of mono sample blocks.
+
+    Buckets are ``bucket_size`` samples wide; samples past the last of
+    ``count`` buckets are ignored and untouched buckets stay at zero, which
+    matches the trim/pad rules of ``reduce_peaks``. With ``count=None`` the
+    buckets grow to cover however many samples arrive.
+    """
+
+    def __init__(self, bucket_size: int, count: int | None):
+        self.bucket_size = bucket_size
+        self.count = count
+        size = count if count is not None else 1024
+        self.mins = np.zeros(size, dtype=np.float64)
+        self.maxs = np.zeros(size, dtype=np.float64)
+        self.abs_max = 0.0
+        self.position = 0
+
+    def _grow(self, needed: int) -> None:
+        if needed <= len(self.mins):
+            return
+        size = max(needed, 2 * len(self.mins))
+        self.mins = np.concatenate([self.mins, np.zeros(size - len(self.mins))])
+        self.maxs = np.concatenate([self.maxs, np.zeros(size - len(self.maxs))])
+
+    def update(self, block: np.ndarray) -> None:
+        start = self.position
+        self.position += len(block)
+        if len(block) == 0:
+            return
+        self.abs_max = max(self.abs_max, _abs_max(block))
+
+        if self.count is None:
+            self._grow(-(-self.position // self.bucket_size))
+        else:
+            limit = self.count * self.bucket_size - start
+            if limit <= 0:
+                return
+            block = block[:limit]
+
+        # Offsets within the block where a bucket begins; a bucket carried
+        # over from the previous block starts at offset 0.
+        first = (-start) % self.bucket_size
+        starts = np.arange(first, len(block), self.bucket_size)
+        if first:
+            starts = np.concatenate(([0], starts))
+        ids = (start + starts) // self.bucket_size
+
+        self.mins[ids] = np.minimum(self.mins[ids], np.minimum.reduceat(block, starts))
+        self.maxs[ids] = np.maximum(self.maxs[ids], np.maximum.reduceat(block, starts))
+
+    def peaks(self) -> np.ndarray:
+        """Absolute peak per bucket (not normalized)."""
+        return np.maximum(self.maxs, -self.mins)
+
+    def used(self) -> int:
+        """Buckets that have received samples."""
+        used = -(-self.position // self.bucket_size)
+        return used if self.count is None else min(used, self.count)
+
+
+def probe_audio(path: str) -> tuple[int, int, int]:
+    """Return ``(sample_rate, channels, estimated_frames)`` using ffprobe.
+
+    The frame count is exact for PCM containers that report ``duration_ts``
+    in samples and an estimate from the stream duration otherwise.
+    """
+    out = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=sample_rate,channels,duration_ts,time_base,duration",
+            "-show_entries", "format=duration",
+            "-of", "json", path,
+        ],
+        capture_output=True,
+        check=True,
+    ).stdout
+    info = json.loads(out)
+    stream = info["streams"][0]
+    sample_rate = int(stream["sample_rate"])
+    channels = int(stream["channels"])
+
+    if stream.get("time_base") == f"1/{sample_rate}" and stream.get("duration_ts"):
+        frames = int(stream["duration_ts"])
+    else:
+        duration = stream.get("duration") or info.get("format", {}).get("duration") or 0
+        frames = round(float(duration) * sample_rate)
+    return sample_rate, channels, frames
+
+
+def stream_pcm(
+    path: str, channels: int, block_frames: int = STREAM_BLOCK_FRAMES, mono: bool = True
+):
+    """Yield float32 sample blocks decoded by an ffmpeg subprocess.
+
+    With ``mono`` channels are downmixed by averaging, the same as the
+    in-memory path; otherwise blocks are ``(frames, channels)``. Only
+    ``block_frames`` frames are resident at a time.
+    """
+    proc = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-i", path, "-f", "f32le", "-acodec", "pcm_f32le", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    frame_bytes = 4 * channels
+    finished = False
+    try:
+        while True:
+            buf = proc.stdout.read(block_frames * frame_bytes)
+            if not buf:
+                break
+            usable = len(buf) - len(buf) % frame_bytes
+            block = np.frombuffer(buf[:usable], dtype=np.float32).reshape(-1, channels)
+            if mono:
+                block = block.mean(axis=1, dtype=np.float32) if channels > 1 else block[:, 0]
+            yield block
+        finished = True
+    finally:
+        if not finished:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {proc.returncode}")
+
+
+def analyze_audio_streaming(path: str, num_peaks: int = NUM_PEAKS) -> AudioAnalysis:
+    """Bounded-memory variant of ``analyze_audio`` for files on disk.
+
+    Peak memory is one decode block plus the pyramid's base buckets, which
+    grow with the decoded length rather than trusting the probed one (VBR
+    files and bad headers misreport it). The overview peaks are bucketed
+    exactly like ``reduce_peaks`` when the probe got the length right (PCM
+    containers); otherwise they are taken from the finished base level, so
+    the tail of the file is still covered.
+    """
+    sample_rate, channels, est_frames = probe_audio(path)
+    spp = base_samples_per_pixel(est_frames)
+    pyramid = BucketReducer(spp, None)
+    overview = None
+    if est_frames:
+        overview = BucketReducer(max(1, est_frames // num_peaks), num_peaks)
+    extractor = _extractor(sample_rate, channels)
+    for block in stream_pcm(path, channels, mono=False):
+        mono = block.mean(axis=1, dtype=np.float32) if channels > 1 else block[:, 0]
+        pyramid.update(mono)
+        if overview is not None:
+            overview.update(mono)
+        if extractor is not None:
+            extractor.update(block, mono)
+
+    frames = pyramid.position
+    used = pyramid.used()
+    mins, maxs = pyramid.mins[:used], pyramid.maxs[:used]
+    # Longer than probed: coarsen until the base level fits the size cap again
+    while len(mins) > MAX_BASE_PIXELS:
+        pad = len(mins) % 2
+        mins = np.pad(mins, (0, pad)).reshape(-1, 2).min(axis=1)
+        maxs = np.pad(maxs, (0, pad)).reshape(-1, 2).max(axis=1)
+        spp *= 2
+    if overview is not None and frames == est_frames:
+        peaks = _normalize(overview.peaks(), overview.abs_max, num_peaks)
+    else:
+        peaks = _overview(np.maximum(maxs, -mins), pyramid.abs_max, num_peaks)
+    return AudioAnalysis(
+        duration=frames / sample_rate if sample_rate else 0.0,
+        sample_rate=sample_rate,
+        channels=channels,
+        frames=frames,
+        peaks=peaks,
+        pyramid=PeakPyramid.from_buckets(mins, maxs, spp, pyramid.abs_max, sample_rate, frames),
+        **_features(extractor),
+    )
+
+
+def _overview(bucket_peaks: np.ndarray, abs_max: float, num_peaks: int) -> list[float]:
+    """``num_peaks`` normalized peaks spanning all of ``bucket_peaks``.
+
+    Only used when the decoded length differs from the probed one. Buckets
+    are split as evenly as possible; with fewer buckets than peaks, buckets
+    are repeated so the waveform still fills the width.
+    """
+    if len(bucket_peaks) == 0:
         return [0.0] * num_peaks
+    edges = np.arange(num_peaks) * len(bucket_peaks) // num_peaks
+    return _normalize(np.maximum.reduceat(bucket_peaks, edges), abs_max, num_peaks)
 
 
-def get_duration(audio_data: bytes) -> float:
-    """Get duration in seconds from audio data."""
+def analyze_audio_memory(source: bytes | str, num_peaks: int = NUM_PEAKS) -> AudioAnalysis:
+    """Decode the whole file with pydub and analyze it in one pass over the samples."""
+    audio = _decode(source)
+    samples = _mono_samples(audio)
+    frames = len(samples)
+    spp = base_samples_per_pixel(frames)
+    pyramid = BucketReducer(spp, -(-frames // spp))
+    pyramid.update(samples)
+    extractor = _extractor(audio.frame_rate, audio.channels)
+    if extractor is not None:
+        _feed_segment(extractor, audio)
+
+    return AudioAnalysis(
+        duration=audio.duration_seconds,
+        sample_rate=audio.frame_rate,
+        channels=audio.channels,
+        frames=frames,
+        peaks=reduce_peaks(samples, num_peaks),
+        pyramid=PeakPyramid.from_buckets(
+            pyramid.mins, pyramid.maxs, spp, pyramid.abs_max, audio.frame_rate, frames
+        ),
+        **_features(extractor),
+    )
+
+
+def _feed_segment(extractor: FeatureExtractor, audio) -> None:
+    """Feed a decoded pydub segment to ``extractor`` in streaming-sized blocks."""
+    samples = np.array(audio.get_array_of_samples())
+    frames = len(samples) // audio.channels
+    samples = samples[: frames * audio.channels].reshape(frames, audio.channels)
+    scale = 1.0 / (1 << (8 * audio.sample_width - 1))
+    for start in range(0, frames, STREAM_BLOCK_FRAMES):
+        block = samples[start : start + STREAM_BLOCK_FRAMES].astype(np.float32) * scale
+        extractor.update(block)
+
+
+def _should_stream(source: bytes | str) -> bool:
+    """Stream when the decoded PCM would be large, whatever the file size.
+
+    An hour of 64 kbps MP3 is under 30 MB on disk but ~600 MB as 16-bit
+    PCM, before the in-memory path's float copies.
+    """
+    if isinstance(source, bytes):
+        return False
     try:
-        from pydub import AudioSegment
+        _, channels, frames = probe_audio(source)
+    except Exception:
+        # Unreadable here means unreadable there too; don't risk a full decode
+        return True
+    if not frames:
+        # Unknown length
+        return True
+    return frames * channels * PCM_SAMPLE_BYTES >= settings.audio_stream_min_bytes
 
-        audio = AudioSegment.from_file(io.BytesIO(audio_data))
-        return audio.duration_seconds
+
+def analyze_audio(
+    source: bytes | str,
+    num_peaks: int = NUM_PEAKS,
+    streaming: bool | None = None,
+) -> AudioAnalysis:
+    """Decode audio once and return duration, peaks, peak pyramid and channel info.
+
+    ``source`` is either the raw file bytes or a path readable by ffmpeg.
+    Paths whose decoded 16-bit PCM (from ffprobe's duration) would be at
+    least ``settings.audio_stream_min_bytes`` are decoded in streaming mode
+    unless ``streaming`` says otherwise; bytes are always
+    decoded in memory. Returns an empty analysis (zero duration, flat peaks)
+    if decoding fails.
+    """
+    if streaming is None:
+        streaming = _should_stream(source)
+    try:
+        if streaming and not isinstance(source, bytes):
+            return analyze_audio_streaming(source, num_peaks)
+        return analyze_audio_memory(source, num_peaks)
     except Exception:
-        return 0.0
+        return AudioAnalysis(peaks=[0.0] * num_peaks)
+
+
+def compute_peaks(audio_data: bytes, num_peaks: int = NUM_PEAKS) -> list[float]:
+    """Compute waveform peaks from raw audio data.
+
+    Adapted from FlightRecordingAnalyzer's _compute_peaks pattern.
+    Prefer ``analyze_audio`` when duration is needed too.
+    """
+    return analyze_audio(audio_data, num_peaks).peaks
+
+
+def get_duration(audio_data: bytes) -> float:
+    """Get duration in seconds from audio data."""
+    return analyze_audio(audio_data).duration
@@ -0,0 +1,125 @@
+"""iCalendar (RFC 5545) rendering and a per-band cache for the events.ics feed.
+
+Calendar apps poll the feed every few minutes. The rendered body and its
+ETag are kept per band for ``settings.ics_cache_ttl_seconds`` so a poll
+with a matching ``If-None-Match`` is answered without touching Firestore.
+Writes through the API drop the entry; writes made directly by the
+frontend show up once it expires.
+"""
+
+import hashlib
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from config import settings
+
+PRODID = "-//LMS BandHub//Calendar//EN"
+
+
+@dataclass
+class Feed:
+    key: str | None
+    body: str
+    etag: str
+    expires_at: float
+
+
+_feeds: dict[str, Feed] = {}
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold content lines at 75 octets, as RFC 5545 requires."""
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Don't split a UTF-8 sequence
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts)
+
+
+def _ics_time(value: str) -> str | None:
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        # Stored without an offset: emit floating local time
+        return dt.strftime("%Y%m%dT%H%M%S")
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_ics(band_id: str, band_name: str, events: list[dict]) -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape(band_name)}",
+    ]
+    for event in events:
+        start = _ics_time(event.get("start"))
+        if start is None:
+            continue
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{event['id']}@{band_id}.bandhub",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{start}",
+        ]
+        end = _ics_time(event.get("end"))
+        if end is not None:
+            lines.append(f"DTEND:{end}")
+        lines.append(f"SUMMARY:{_escape(event.get('title') or '')}")
+        if event.get("location"):
+            lines.append(f"LOCATION:{_escape(event['location'])}")
+        if event.get("description"):
+            lines.append(f"DESCRIPTION:{_escape(event['description'])}")
+        if event.get("type"):
+            lines.append(f"CATEGORIES:{_escape(event['type'])}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def _etag(body: str) -> str:
+    # DTSTAMP changes on every render; hash without it so unchanged
+    # calendars keep their ETag across cache rebuilds
+    stable = "\r\n".join(
+        line for line in body.split("\r\n") if not line.startswith("DTSTAMP:")
+    )
+    return '"' + hashlib.sha256(stable.encode()).hexdigest()[:32] + '"'
+
+
+def get_feed(band_id: str) -> Feed | None:
+    feed = _feeds.get(band_id)
+    if feed is not None and feed.expires_at > time.monotonic():
+        return feed
+    return None
+
+
+def put_feed(band_id: str, key: str | None, body: str) -> Feed:
+    feed = Feed(key, body, _etag(body), time.monotonic() + settings.ics_cache_ttl_seconds)
+    _feeds[band_id] = feed
+    return feed
+
+
+def invalidate(band_id: str) -> None:
+    _feeds.pop(band_id, None)
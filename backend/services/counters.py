@@ -0,0 +1,52 @@
+"""Sharded comment counters for media docs.
+
+With ``settings.comment_count_shards == 1`` (the default) the count lives in
+the media doc's ``commentCount`` field, as it always has. With N > 1 each
+increment lands on one of N shards chosen at random: shard 0 is still the
+media doc's own field and shards 1..N-1 are ``counters/comments-{i}`` docs,
+so a hot track spreads its writes across N documents instead of hitting
+Firestore's per-document write rate. Readers add the shard docs back in.
+"""
+
+import random
+
+from google.cloud.firestore import Increment
+
+from config import settings
+
+COUNTER_COLLECTION = "counters"
+
+
+def _shard_ref(media_ref, shard: int):
+    return media_ref.collection(COUNTER_COLLECTION).document(f"comments-{shard}")
+
+
+def add_increment(batch, media_ref, delta: int) -> bool:
+    """Queue a ``commentCount`` change on ``batch`` (a WriteBatch or transaction).
+
+    Returns True if the write targets the media doc itself, in which case it
+    is an ``update`` and doubles as a "media exists" precondition for the
+    whole commit. Returns False for a shard doc write, which is an upsert.
+    """
+    shards = max(1, settings.comment_count_shards)
+    shard = random.randrange(shards)
+    if shard == 0:
+        batch.update(media_ref, {"commentCount": Increment(delta)})
+        return True
+    batch.set(_shard_ref(media_ref, shard), {"count": Increment(delta)}, merge=True)
+    return False
+
+
+async def shard_totals(db, media_refs: list) -> dict[str, int]:
+    """Sum of shards 1..N-1 per media id; empty when sharding is off."""
+    shards = settings.comment_count_shards
+    if shards <= 1 or not media_refs:
+        return {}
+    refs = [_shard_ref(m, i) for m in media_refs for i in range(1, shards)]
+    totals: dict[str, int] = {}
+    async for snap in db.get_all(refs):
+        if snap.exists:
+            # counters/comments-i -> parent media doc id
+            media_id = snap.reference.parent.parent.id
+            totals[media_id] = totals.get(media_id, 0) + (snap.get("count") or 0)
+    return totals
@@ -0,0 +1,114 @@
+"""A directory of files trimmed to a byte budget, least recently used first."""
+
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+
+class DiskLRU:
+    """Files named ``{key}{suffix}`` under ``directory``, capped at ``max_bytes``.
+
+    Sizes and recency are tracked in memory (seeded from a directory scan on
+    first use); the file's mtime is the recency so it survives restarts.
+    Methods block on disk I/O, so call them from a thread.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int, suffix: str = ".bin"):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[int, float]] | None = None
+
+    def _load(self) -> dict[str, tuple[int, float]]:
+        if self._entries is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._entries = {}
+            for path in self.directory.iterdir():
+                if path.suffix == ".tmp":
+                    # Left over from a write interrupted by a restart
+                    path.unlink(missing_ok=True)
+                elif path.suffix == self.suffix:
+                    stat = path.stat()
+                    self._entries[path.stem] = (stat.st_size, stat.st_mtime)
+        return self._entries
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def path(self, key: str) -> Path | None:
+        """The entry's file, marked as just used, or None if it isn't cached."""
+        with self._lock:
+            entries = self._load()
+            if key not in entries:
+                return None
+            path = self._path(key)
+            try:
+                os.utime(path)
+                stat = path.stat()
+            except FileNotFoundError:
+                entries.pop(key, None)
+                return None
+            entries[key] = (stat.st_size, stat.st_mtime)
+            return path
+
+    def get(self, key: str) -> bytes | None:
+        path = self.path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self._ensure_dir(), suffix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        self._commit(key, tmp)
+
+    def put_file(self, key: str, source: str | Path) -> None:
+        """Move ``source`` into the cache (copying if it's on another filesystem)."""
+        if os.path.getsize(source) > self.max_bytes:
+            os.unlink(source)
+            return
+        fd, tmp = tempfile.mkstemp(dir=self._ensure_dir(), suffix=".tmp")
+        os.close(fd)
+        shutil.move(source, tmp)
+        self._commit(key, tmp)
+
+    def temp_path(self) -> Path:
+        """A fresh path in the cache directory for writing an entry before ``put_file``."""
+        fd, tmp = tempfile.mkstemp(dir=self._ensure_dir(), suffix=".tmp")
+        os.close(fd)
+        return Path(tmp)
+
+    def _ensure_dir(self) -> Path:
+        with self._lock:
+            self._load()
+        return self.directory
+
+    def _commit(self, key: str, tmp: str) -> None:
+        # Rename into place so readers never see a partial entry
+        with self._lock:
+            entries = self._load()
+            path = self._path(key)
+            os.replace(tmp, path)
+            entries[key] = (path.stat().st_size, path.stat().st_mtime)
+            self._evict(entries)
+
+    def _evict(self, entries: dict[str, tuple[int, float]]) -> None:
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+            del entries[key]
+            total -= size
@@ -0,0 +1,135 @@
+"""In-process pub/sub hub feeding the Server-Sent Events endpoints.
+
+Topics are plain strings (e.g. ``"{band_id}/{media_id}"``). Each topic keeps
+a short history so reconnecting clients can resume from ``Last-Event-ID``.
+Only writes made through this process are seen; with several instances a
+client may need to fall back to a full re-read, which the ``reset`` event
+signals.
+"""
+
+import asyncio
+import json
+import secrets
+from collections import OrderedDict, deque
+
+from config import settings
+
+# Event ids are "<epoch>-<seq>"; a new epoch per process means ids from
+# before a restart are recognised as unresumable
+_EPOCH = secrets.token_hex(4)
+
+# Sent (without an id) when a client's Last-Event-ID can't be replayed; the
+# client should re-read the full list
+RESET = "reset"
+
+# Idle topics (no subscribers) beyond this many are forgotten, oldest first
+MAX_TOPICS = 1024
+
+
+class Subscriber:
+    """One SSE client's bounded queue of pending events."""
+
+    def __init__(self, topic: str, maxsize: int):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event: tuple[str | None, str, str]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop its backlog and end the stream. The browser
+            # reconnects with the last id it actually received and the topic
+            # history replays the rest, so memory per client stays bounded.
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> tuple[str | None, str, str] | None:
+        """Next ``(id, event, data)``, or None when the stream should close."""
+        return await self.queue.get()
+
+
+class _Topic:
+    def __init__(self, history: int):
+        self.seq = 0
+        self.history: deque[tuple[int, str, str]] = deque(maxlen=history)
+        self.subscribers: set[Subscriber] = set()
+
+
+class EventHub:
+    def __init__(self, history: int, queue_size: int):
+        self.history = history
+        self.queue_size = queue_size
+        self._topics: OrderedDict[str, _Topic] = OrderedDict()
+
+    def _topic(self, topic: str) -> _Topic:
+        t = self._topics.get(topic)
+        if t is None:
+            t = self._topics[topic] = _Topic(self.history)
+            if len(self._topics) > MAX_TOPICS:
+                for name in [n for n, old in self._topics.items() if not old.subscribers]:
+                    if len(self._topics) <= MAX_TOPICS:
+                        break
+                    del self._topics[name]
+        self._topics.move_to_end(topic)
+        return t
+
+    def publish(self, topic: str, event: str, data: dict) -> str:
+        t = self._topic(topic)
+        t.seq += 1
+        payload = json.dumps(data, default=str)
+        t.history.append((t.seq, event, payload))
+        event_id = f"{_EPOCH}-{t.seq}"
+        for sub in t.subscribers:
+            sub.offer((event_id, event, payload))
+        return event_id
+
+    def subscribe(self, topic: str, last_event_id: str | None = None) -> Subscriber:
+        """Register a subscriber, replaying anything after ``last_event_id``.
+
+        If the id is from another process or older than the retained history,
+        the subscriber's first event is ``reset``.
+        """
+        t = self._topic(topic)
+        replay: list[tuple[str | None, str, str]] = []
+        if last_event_id:
+            epoch, _, seq = last_event_id.partition("-")
+            oldest = t.history[0][0] if t.history else t.seq + 1
+            if (
+                epoch != _EPOCH
+                or not seq.isdigit()
+                or int(seq) > t.seq
+                or int(seq) + 1 < oldest
+            ):
+                replay.append((None, RESET, "{}"))
+            else:
+                replay.extend(
+                    (f"{_EPOCH}-{seq_no}", event, payload)
+                    for seq_no, event, payload in t.history
+                    if seq_no > int(seq)
+                )
+
+        # Room for the replay on top of the normal live backlog
+        sub = Subscriber(topic, self.queue_size + len(replay))
+        for event in replay:
+            sub.offer(event)
+        t.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        t = self._topics.get(sub.topic)
+        if t is None:
+            return
+        t.subscribers.discard(sub)
+
+
+hub = EventHub(settings.sse_history_size, settings.sse_queue_size)
+
+
+def format_sse(event_id: str | None, event: str, data: str) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
@@ -0,0 +1,382 @@
+"""Loudness, true-peak, tempo and key estimation in NumPy, fed block by block.
+
+``FeatureExtractor.update`` takes the same decoded PCM blocks the peak
+reducers see, so analysis still decodes once. Work is done per block with
+FFTs and only small per-frame summaries are kept (10 loudness values per
+second, one onset value and a 12-bin chroma sum per STFT frame), so memory
+stays bounded on hour-long rehearsal recordings.
+
+- Integrated loudness follows ITU-R BS.1770-4 (K-weighting, 400 ms blocks
+  with 75% overlap, -70 LUFS absolute and -10 LU relative gates). The
+  K-weighting is applied in the frequency domain to each 100 ms hop.
+- True peak is the sample peak of the signal oversampled 4x with a
+  polyphase FIR, skipping chunks too quiet to set a new maximum.
+- Tempo is the autocorrelation peak of a spectral-flux onset envelope,
+  weighted towards 120 BPM, and only reported if that peak clearly stands
+  out (otherwise there is no beat to speak of).
+- Key is the best Krumhansl-Schmuckler profile match for the summed chroma.
+- The fingerprint is the mean 2-D Fourier magnitude of ~16 s chroma
+  patches, which doesn't change with where in the file a take starts or
+  which key it is played in, so takes of the same song land close together.
+"""
+
+import math
+
+import numpy as np
+
+# K-weighting stages (high shelf, then RLB high-pass) as analog prototypes,
+# realised per sample rate with the bilinear transform, as in BS.1770
+SHELF_GAIN_DB = 3.999843853973347
+SHELF_Q = 0.7071752369554196
+SHELF_FC = 1681.974450955533
+SHELF_VB_EXPONENT = 0.4996667741545416
+HIGHPASS_Q = 0.5003270373238773
+HIGHPASS_FC = 38.13547087613982
+
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# True peak: 4x polyphase FIR interpolation (as in BS.1770 Annex 2), run
+# per power-of-two chunk and only where the chunk's sample peak is within
+# TRUE_PEAK_GATE_DB of the running maximum
+OVERSAMPLE = 4
+TRUE_PEAK_TAPS = 12
+TRUE_PEAK_CHUNK = 4096
+TRUE_PEAK_GATE_DB = 4.0
+
+MIN_BPM, MAX_BPM, PRIOR_BPM = 60.0, 200.0, 120.0
+# The tempo peak must stand this many times above the median autocorrelation
+# in the tempo range. Steady tones and pads, whose onset envelope only
+# drifts, come out around 2; drum-led takes 8 and up.
+MIN_TEMPO_STRENGTH = 4.0
+# Below this much audio, tempo and key are too unreliable to report
+MIN_FEATURE_SECONDS = 5.0
+# Chroma only from bins in roughly C2..C7
+CHROMA_FMIN, CHROMA_FMAX = 65.0, 2100.0
+
+# Fingerprint: chroma averaged over 0.5 s segments, patches of 32 segments
+# (16 s) every 8 segments
+SEGMENT_SECONDS = 0.5
+PATCH_SEGMENTS = 32
+PATCH_HOP = 8
+# Shorter recordings are zero padded up to one patch; below this, no fingerprint
+MIN_FINGERPRINT_SEGMENTS = 8
+FINGERPRINT_SIZE = PATCH_SEGMENTS * 7 - 1
+
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _biquad_response(b, a, freqs: np.ndarray, sample_rate: int) -> np.ndarray:
+    """|H|^2 of a biquad at ``freqs`` Hz."""
+    z = np.exp(-1j * 2 * np.pi * freqs / sample_rate)
+    num = b[0] + b[1] * z + b[2] * z**2
+    den = a[0] + a[1] * z + a[2] * z**2
+    return np.abs(num / den) ** 2
+
+
+def k_weighting(freqs: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Power response of the BS.1770 K-weighting filter at ``freqs`` Hz."""
+    K = math.tan(math.pi * SHELF_FC / sample_rate)
+    Vh = 10 ** (SHELF_GAIN_DB / 20)
+    Vb = Vh**SHELF_VB_EXPONENT
+    a0 = 1 + K / SHELF_Q + K * K
+    shelf_b = (
+        (Vh + Vb * K / SHELF_Q + K * K) / a0,
+        2 * (K * K - Vh) / a0,
+        (Vh - Vb * K / SHELF_Q + K * K) / a0,
+    )
+    shelf_a = (1.0, 2 * (K * K - 1) / a0, (1 - K / SHELF_Q + K * K) / a0)
+
+    K = math.tan(math.pi * HIGHPASS_FC / sample_rate)
+    a0 = 1 + K / HIGHPASS_Q + K * K
+    hp_b = (1.0, -2.0, 1.0)
+    hp_a = (1.0, 2 * (K * K - 1) / a0, (1 - K / HIGHPASS_Q + K * K) / a0)
+    return _biquad_response(shelf_b, shelf_a, freqs, sample_rate) * _biquad_response(
+        hp_b, hp_a, freqs, sample_rate
+    )
+
+
+class _Buffer:
+    """Accumulates blocks and hands back whole frames of ``size``, stepping by ``hop``."""
+
+    def __init__(self, size: int, hop: int, channels: int):
+        self.size = size
+        self.hop = hop
+        self.data = np.zeros((0, channels), dtype=np.float32)
+
+    def frames(self, block: np.ndarray) -> np.ndarray | None:
+        data = np.concatenate([self.data, block]) if len(self.data) else block
+        count = (len(data) - self.size) // self.hop + 1 if len(data) >= self.size else 0
+        self.data = data[count * self.hop :]
+        if not count:
+            return None
+        # (count, size, channels) view, no copy
+        view = np.lib.stride_tricks.sliding_window_view(data, self.size, axis=0)
+        return view[: count * self.hop : self.hop].transpose(0, 2, 1)
+
+
+class LoudnessMeter:
+    def __init__(self, sample_rate: int, channels: int):
+        self.hop = max(1, round(sample_rate * 0.1))
+        self.buffer = _Buffer(self.hop, self.hop, channels)
+        freqs = np.fft.rfftfreq(self.hop, 1 / sample_rate)
+        # One-sided spectrum: every bin but DC (and Nyquist) stands for two
+        weights = k_weighting(freqs, sample_rate) * 2
+        weights[0] /= 2
+        if self.hop % 2 == 0:
+            weights[-1] /= 2
+        self.weights = weights / self.hop**2
+        # Channel-summed K-weighted mean square per 100 ms hop
+        self.powers: list[np.ndarray] = []
+
+    def update(self, block: np.ndarray) -> None:
+        hops = self.buffer.frames(block)
+        if hops is None:
+            return
+        spectrum = np.fft.rfft(hops, axis=1)
+        power = (np.abs(spectrum) ** 2 * self.weights[:, None]).sum(axis=(1, 2))
+        self.powers.append(power)
+
+    def integrated(self) -> float | None:
+        if not self.powers:
+            return None
+        hops = np.concatenate(self.powers)
+        if len(hops) < 4:
+            return None
+        # 400 ms gating blocks = 4 consecutive hops
+        blocks = np.convolve(hops, np.ones(4) / 4, mode="valid")
+        with np.errstate(divide="ignore"):
+            levels = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[levels > ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        threshold = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE
+        gated = blocks[(levels > ABSOLUTE_GATE) & (levels > threshold)]
+        return -0.691 + 10 * math.log10(gated.mean())
+
+
+def _oversampling_filter() -> np.ndarray:
+    """``(TRUE_PEAK_TAPS, OVERSAMPLE)`` polyphase interpolator, taps in reverse order.
+
+    A Kaiser-windowed sinc, each phase normalised to unity gain at DC.
+    """
+    size = OVERSAMPLE * TRUE_PEAK_TAPS
+    t = (np.arange(size) - (size - 1) / 2) / OVERSAMPLE
+    taps = np.sinc(t) * np.kaiser(size, 6.0)
+    # phases[k, p] multiplies x[n - k] for output sample 4n + p
+    phases = taps.reshape(TRUE_PEAK_TAPS, OVERSAMPLE)
+    return (phases / phases.sum(axis=0))[::-1].astype(np.float32)
+
+
+class TruePeakMeter:
+    def __init__(self, channels: int):
+        self.filter = _oversampling_filter()
+        # Starts empty rather than zeroed, so the jump from silence into the
+        # first sample doesn't ring and read as an over
+        self.tail = np.zeros((0, channels), dtype=np.float32)
+        self.peak = 0.0
+        self.gate = 10 ** (-TRUE_PEAK_GATE_DB / 20)
+
+    def update(self, block: np.ndarray) -> None:
+        for start in range(0, len(block), TRUE_PEAK_CHUNK):
+            self._update(block[start : start + TRUE_PEAK_CHUNK])
+
+    def _update(self, chunk: np.ndarray) -> None:
+        sample_peak = float(np.abs(chunk).max())
+        segment = np.concatenate([self.tail, chunk])
+        self.tail = segment[-(TRUE_PEAK_TAPS - 1) :]
+        self.peak = max(self.peak, sample_peak)
+        # Intersample overs are at most a few dB above the samples around
+        # them, so quiet chunks can't raise the running maximum
+        if sample_peak < self.peak * self.gate or len(segment) < TRUE_PEAK_TAPS:
+            return
+        for channel in segment.T:
+            # A contiguous (n, taps) copy lets the product go through BLAS
+            windows = np.lib.stride_tricks.sliding_window_view(channel, TRUE_PEAK_TAPS)
+            upsampled = np.ascontiguousarray(windows) @ self.filter
+            self.peak = max(self.peak, float(np.abs(upsampled).max()))
+
+    def db(self) -> float | None:
+        return 20 * math.log10(self.peak) if self.peak > 0 else None
+
+
+class ChromaFingerprint:
+    """Fixed-size, shift- and transposition-invariant summary of a chroma sequence."""
+
+    def __init__(self, frames_per_segment: int):
+        self.frames_per_segment = max(1, frames_per_segment)
+        self.pending = np.zeros((0, 12), dtype=np.float32)
+        self.segments: list[np.ndarray] = []
+        self.total = np.zeros((PATCH_SEGMENTS, 7))
+        self.patches = 0
+
+    def update(self, chroma: np.ndarray) -> None:
+        """Add per-frame chroma rows."""
+        data = np.concatenate([self.pending, chroma])
+        whole = len(data) // self.frames_per_segment
+        self.pending = data[whole * self.frames_per_segment :]
+        if not whole:
+            return
+        segments = data[: whole * self.frames_per_segment].reshape(
+            whole, self.frames_per_segment, 12
+        ).mean(axis=1)
+        segments /= np.maximum(segments.max(axis=1, keepdims=True), 1e-12)
+        self.segments.extend(segments)
+        # Only the tail of the last patch is needed to start the next one
+        while len(self.segments) >= PATCH_SEGMENTS:
+            self._add_patch(np.array(self.segments[:PATCH_SEGMENTS]))
+            del self.segments[:PATCH_HOP]
+
+    def _add_patch(self, patch: np.ndarray) -> None:
+        # Magnitude discards circular shifts in time and in pitch class
+        self.total += np.abs(np.fft.rfft2(patch))
+        self.patches += 1
+
+    def vector(self) -> np.ndarray | None:
+        """Zero-mean, unit-norm float32 vector of ``FINGERPRINT_SIZE``, or None."""
+        if not self.patches:
+            if len(self.segments) < MIN_FINGERPRINT_SEGMENTS:
+                return None
+            patch = np.zeros((PATCH_SEGMENTS, 12))
+            patch[: len(self.segments)] = self.segments
+            self._add_patch(patch)
+        mean = self.total / self.patches
+        # Blur across modulation frequency so takes a few % apart in tempo overlap
+        mean = (np.roll(mean, 1, axis=0) + 2 * mean + np.roll(mean, -1, axis=0)) / 4
+        # Drop the DC term (overall level), compress the dynamic range
+        values = np.log1p(mean.ravel()[1:])
+        values -= values.mean()
+        norm = np.linalg.norm(values)
+        if norm == 0:
+            return None
+        return (values / norm).astype(np.float32)
+
+
+class SpectralFeatures:
+    """STFT-based onset envelope (for tempo) and chroma sum (for key) of a mono signal."""
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        # ~93 ms frames: 4096 at 44.1/48 kHz
+        self.n_fft = 1 << max(9, round(math.log2(sample_rate * 0.093)))
+        self.hop = self.n_fft // 4
+        self.buffer = _Buffer(self.n_fft, self.hop, 1)
+        self.window = np.hanning(self.n_fft).astype(np.float32)
+        freqs = np.fft.rfftfreq(self.n_fft, 1 / sample_rate)
+
+        in_range = (freqs >= CHROMA_FMIN) & (freqs <= CHROMA_FMAX)
+        self.chroma_bins = np.flatnonzero(in_range)
+        pitch = np.rint(12 * np.log2(freqs[self.chroma_bins] / 440.0)).astype(int) + 9
+        self.chroma_map = np.zeros((len(self.chroma_bins), 12), dtype=np.float32)
+        self.chroma_map[np.arange(len(self.chroma_bins)), pitch % 12] = 1.0
+
+        self.prev: np.ndarray | None = None
+        self.onsets: list[np.ndarray] = []
+        self.chroma = np.zeros(12)
+        self.fingerprint = ChromaFingerprint(round(SEGMENT_SECONDS * self.frame_rate))
+
+    @property
+    def frame_rate(self) -> float:
+        return self.sample_rate / self.hop
+
+    def update(self, mono: np.ndarray) -> None:
+        frames = self.buffer.frames(mono[:, None])
+        if frames is None:
+            return
+        mag = np.abs(np.fft.rfft(frames[:, :, 0] * self.window, axis=1)).astype(np.float32)
+
+        log_mag = np.log1p(1000 * mag)
+        # The very first frame is compared with itself, so has no onset
+        first = log_mag[0] if self.prev is None else self.prev
+        previous = np.concatenate([first[None], log_mag[:-1]])
+        self.onsets.append(np.maximum(log_mag - previous, 0).sum(axis=1))
+        self.prev = log_mag[-1]
+
+        chroma = (mag[:, self.chroma_bins] ** 2) @ self.chroma_map
+        # Normalise per frame so loud passages don't drown out the rest
+        peak = chroma.max(axis=1, keepdims=True)
+        chroma = chroma / np.maximum(peak, 1e-12)
+        self.chroma += chroma.sum(axis=0)
+        self.fingerprint.update(chroma)
+
+    def seconds(self) -> float:
+        return sum(len(o) for o in self.onsets) / self.frame_rate
+
+    def bpm(self) -> float | None:
+        if not self.onsets or self.seconds() < MIN_FEATURE_SECONDS:
+            return None
+        env = np.concatenate(self.onsets)
+        env = env - env.mean()
+        n = len(env)
+        spectrum = np.fft.rfft(env, 2 * n)
+        ac = np.fft.irfft(np.abs(spectrum) ** 2)[:n]
+        if ac[0] <= 0:
+            return None
+
+        lo = max(1, int(60 * self.frame_rate / MAX_BPM))
+        hi = min(n - 2, int(math.ceil(60 * self.frame_rate / MIN_BPM)))
+        if hi <= lo:
+            return None
+        lags = np.arange(lo, hi + 1)
+        bpms = 60 * self.frame_rate / lags
+        prior = np.exp(-0.5 * np.log2(bpms / PRIOR_BPM) ** 2)
+        best = lags[np.argmax(ac[lags] * prior)]
+        typical = np.median(np.abs(ac[lags]))
+        if typical <= 0 or ac[best] < MIN_TEMPO_STRENGTH * typical:
+            return None
+
+        # Parabolic interpolation around the peak for sub-frame lag
+        y0, y1, y2 = ac[best - 1], ac[best], ac[best + 1]
+        denom = y0 - 2 * y1 + y2
+        shift = 0.5 * (y0 - y2) / denom if denom else 0.0
+        return round(float(60 * self.frame_rate / (best + shift)), 1)
+
+    def key(self) -> tuple[str, float] | None:
+        if self.seconds() < MIN_FEATURE_SECONDS or not self.chroma.any():
+            return None
+        best = None
+        for mode, profile in (("major", MAJOR_PROFILE), ("minor", MINOR_PROFILE)):
+            for tonic in range(12):
+                r = float(np.corrcoef(self.chroma, np.roll(profile, tonic))[0, 1])
+                if best is None or r > best[1]:
+                    best = (f"{PITCH_CLASSES[tonic]} {mode}", r)
+        return best
+
+
+class FeatureExtractor:
+    """Feed ``(frames, channels)`` float blocks in [-1, 1], then read ``result()``."""
+
+    def __init__(self, sample_rate: int, channels: int):
+        self.loudness = LoudnessMeter(sample_rate, channels)
+        self.true_peak = TruePeakMeter(channels)
+        self.spectral = SpectralFeatures(sample_rate)
+
+    def update(self, block: np.ndarray, mono: np.ndarray | None = None) -> None:
+        block = np.asarray(block, dtype=np.float32)
+        if mono is None:
+            mono = block.mean(axis=1, dtype=np.float32)
+        self.loudness.update(block)
+        self.true_peak.update(block)
+        self.spectral.update(np.asarray(mono, dtype=np.float32))
+
+    def result(self) -> dict:
+        """``loudness`` (LUFS), ``true_peak`` (dBTP), ``bpm``, ``key``, ``key_confidence``
+        and ``fingerprint`` (a list of ``FINGERPRINT_SIZE`` floats).
+
+        Values that can't be estimated (silence, too short) are None.
+        """
+        key = self.spectral.key()
+        bpm = self.spectral.bpm()
+        loudness = self.loudness.integrated()
+        true_peak = self.true_peak.db()
+        fingerprint = self.spectral.fingerprint.vector()
+        return {
+            "loudness": round(loudness, 2) if loudness is not None else None,
+            "true_peak": round(true_peak, 2) if true_peak is not None else None,
+            "bpm": bpm,
+            "key": key[0] if key else None,
+            "key_confidence": round(key[1], 3) if key else None,
+            "fingerprint": fingerprint.tolist() if fingerprint is not None else None,
+        }
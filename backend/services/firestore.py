@@ -1,12 +1,114 @@
 """Firestore client helpers."""
 
+import time
+
 from google.cloud import firestore
 
+from services import metrics
+
+# GAPIC methods by the kind of work they do; anything else is "other"
+READ_METHODS = {
+    "batch_get_documents",
+    "run_query",
+    "run_aggregation_query",
+    "get_document",
+    "list_documents",
+    "list_collection_ids",
+    "partition_query",
+}
+WRITE_METHODS = {"commit", "batch_write", "create_document", "update_document", "delete_document"}
+# These return a response stream once awaited
+STREAMING_METHODS = {"batch_get_documents", "run_query", "run_aggregation_query"}
+
 _client: firestore.Client | None = None
+_async_client: firestore.AsyncClient | None = None
 
 
 def get_db() -> firestore.Client:
+    """Blocking client, for scripts and code that already runs off the event loop."""
     global _client
     if _client is None:
         _client = firestore.Client()
     return _client
+
+
+class _TimedStream:
+    def __init__(self, stream, method: str, kind: str, start: float):
+        self._stream = stream
+        self._method = method
+        self._kind = kind
+        self._start = start
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for item in self._stream:
+                yield item
+        finally:
+            metrics.observe(
+                metrics.firestore_latency,
+                time.perf_counter() - self._start,
+                self._method,
+                self._kind,
+                phase=f"fs-{self._kind}",
+            )
+
+
+class _InstrumentedApi:
+    """Wraps the GAPIC client so every RPC is timed and counted."""
+
+    def __init__(self, api):
+        self._api = api
+        self._wrapped = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        wrapper = self._wrapped.get(name)
+        if wrapper is None:
+            wrapper = self._wrapped[name] = self._wrap(name, attr)
+        return wrapper
+
+    @staticmethod
+    def _wrap(name, method):
+        kind = "read" if name in READ_METHODS else "write" if name in WRITE_METHODS else "other"
+
+        async def call(*args, **kwargs):
+            start = time.perf_counter()
+            if name in STREAMING_METHODS:
+                return _TimedStream(await method(*args, **kwargs), name, kind, start)
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                metrics.observe(
+                    metrics.firestore_latency,
+                    time.perf_counter() - start,
+                    name,
+                    kind,
+                    phase=f"fs-{kind}",
+                )
+
+        return call
+
+
+class InstrumentedAsyncClient(firestore.AsyncClient):
+    """AsyncClient whose RPCs feed ``services.metrics``."""
+
+    @property
+    def _firestore_api(self):
+        api = super()._firestore_api
+        if not isinstance(api, _InstrumentedApi):
+            api = self._firestore_api_internal = _InstrumentedApi(api)
+        return api
+
+
+def get_async_db() -> firestore.AsyncClient:
+    """Client for request handlers; every call is awaited so the loop keeps serving."""
+    global _async_client
+    if _async_client is None:
+        cls = InstrumentedAsyncClient if metrics.ENABLED else firestore.AsyncClient
+        _async_client = cls()
+    return _async_client
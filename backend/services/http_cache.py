@@ -0,0 +1,55 @@
+"""Strong ETags from Firestore update times, and If-None-Match handling.
+
+Read endpoints hash the ``update_time`` of every document that went into
+the response (plus anything else that shapes it, like query parameters),
+so a client polling an unchanged resource gets a bodyless 304. The
+Firestore reads still happen; what's saved is serialising and sending
+the body.
+"""
+
+import hashlib
+
+from fastapi import Request, Response
+
+# Clients may store the response but must revalidate before reusing it
+REVALIDATE = "private, no-cache"
+
+
+def stamp(snapshot) -> str:
+    """``id@update_time`` for a snapshot, with Firestore's nanoseconds."""
+    t = snapshot.update_time
+    if t is None:
+        return f"{snapshot.id}@-"
+    return f"{snapshot.id}@{t.isoformat()}.{getattr(t, 'nanosecond', 0)}"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+    return '"' + digest.hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in tags
+
+
+def not_modified(
+    request: Request, response: Response, etag: str, cache_control: str = REVALIDATE
+) -> Response | None:
+    """Set validators on ``response``.
+
+    Returns a 304 to send instead if the client's copy is current.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+        return Response(status_code=304, headers=headers)
+    return None
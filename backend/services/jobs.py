@@ -0,0 +1,259 @@
+"""Background audio analysis - bounded job queue in front of a worker pool."""
+
+import abc
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from google.cloud.firestore import DELETE_FIELD, SERVER_TIMESTAMP
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from services.audio import AudioAnalysis, analyze_audio, warm_audio_stack
+from services import analysis_cache, metrics, previews, similarity
+from services.firestore import get_async_db
+from services.peak_store import store_pyramid
+from services.peaks import encode_peaks
+from services.similarity import encode_fingerprint
+
+# Finished job records kept in memory for the status endpoint
+MAX_JOB_RECORDS = 1000
+# How long shutdown waits for pool workers (one may be mid-decode)
+SHUTDOWN_WAIT_SECONDS = 5
+
+# Media doc fields written by analysis; copied as-is when a band re-uploads
+# identical content
+ANALYSIS_FIELDS = [
+    "duration", "peaksData", "sampleRate", "channels",
+    "loudness", "truePeak", "detectedBpm", "detectedKey", "keyConfidence", "fingerprint",
+]
+
+# Estimated features -> media doc field. Kept apart from the hand-entered
+# songInfo.bpm/key so an estimate never overwrites what the band typed in.
+FEATURE_FIELDS = {
+    "loudness": "loudness",
+    "true_peak": "truePeak",
+    "bpm": "detectedBpm",
+    "key": "detectedKey",
+    "key_confidence": "keyConfidence",
+}
+
+
+def analysis_fields(analysis: AudioAnalysis) -> dict:
+    """Media doc fields for a finished analysis."""
+    fields = {
+        "duration": analysis.duration,
+        "peaksData": encode_peaks(analysis.peaks),
+        "sampleRate": analysis.sample_rate,
+        "channels": analysis.channels,
+        "analysisStatus": "ready",
+        "analyzedAt": SERVER_TIMESTAMP,
+    }
+    for attr, name in FEATURE_FIELDS.items():
+        value = getattr(analysis, attr)
+        if value is not None:
+            fields[name] = value
+    if analysis.fingerprint is not None:
+        fields["fingerprint"] = encode_fingerprint(analysis.fingerprint)
+    return fields
+
+
+class QueueFull(Exception):
+    """Raised when the analysis queue has no room for another job."""
+
+
+class AnalysisRunner(abc.ABC):
+    """Runs ``analyze_audio`` off the event loop and patches results into Firestore.
+
+    Jobs go into a bounded asyncio queue drained by ``workers`` consumer
+    tasks; subclasses decide where the decode itself runs. The runner owns
+    the file passed to ``submit`` and deletes it when the job finishes.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            # Fresh context: workers outlive the request that happens to start them
+            self._tasks = [
+                asyncio.create_task(self._worker(), context=contextvars.Context())
+                for _ in range(self.workers)
+            ]
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def submit(
+        self, band_id: str, media_id: str, path: str, content_hash: str | None = None
+    ) -> None:
+        """Queue analysis of ``path`` for the given media doc.
+
+        With ``content_hash`` the result is also stored in ``analysis_cache``.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((band_id, media_id, path, content_hash))
+        except asyncio.QueueFull:
+            raise QueueFull() from None
+        self._record(media_id, {"bandId": band_id, "status": "pending"})
+
+    def status(self, media_id: str) -> dict | None:
+        return self._jobs.get(media_id)
+
+    def _record(self, media_id: str, job: dict) -> None:
+        self._jobs[media_id] = job
+        self._jobs.move_to_end(media_id)
+        while len(self._jobs) > MAX_JOB_RECORDS:
+            self._jobs.popitem(last=False)
+
+    async def _worker(self) -> None:
+        while True:
+            band_id, media_id, path, content_hash = await self._queue.get()
+            self._record(media_id, {"bandId": band_id, "status": "running"})
+            start = time.perf_counter()
+            try:
+                analysis = await self._run(path)
+                # analyze_audio reports a decode failure as an empty analysis
+                if not analysis.frames:
+                    raise ValueError("Could not decode audio")
+                metrics.observe(metrics.analysis_latency, time.perf_counter() - start, "ok")
+                await self._complete(band_id, media_id, analysis)
+                self._record(media_id, {"bandId": band_id, "status": "ready"})
+                if content_hash:
+                    try:
+                        await analysis_cache.put(content_hash, analysis)
+                    except Exception:
+                        pass
+                    # The spooled upload is still here, so transcode now
+                    await previews.build_preview(content_hash, path)
+            except Exception as e:
+                metrics.observe(metrics.analysis_latency, time.perf_counter() - start, "failed")
+                self._record(media_id, {"bandId": band_id, "status": "failed", "error": str(e)})
+                await self._fail(band_id, media_id, str(e))
+            finally:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                self._queue.task_done()
+
+    @abc.abstractmethod
+    async def _run(self, path: str) -> AudioAnalysis:
+        """Decode and analyse the file at ``path``."""
+
+    async def warm(self) -> None:
+        """Load the decode stack ahead of the first job."""
+        await run_in_threadpool(warm_audio_stack)
+
+    async def _complete(self, band_id: str, media_id: str, analysis: AudioAnalysis) -> None:
+        if analysis.pyramid is not None:
+            await store_pyramid(band_id, media_id, analysis.pyramid)
+        fields = analysis_fields(analysis)
+        # peaksData replaces any float list the frontend computed at upload
+        await _patch_media(band_id, media_id, {**fields, "peaks": DELETE_FIELD})
+        similarity.record_write(band_id, media_id, fields)
+
+    async def _fail(self, band_id: str, media_id: str, error: str) -> None:
+        try:
+            await _patch_media(band_id, media_id, {"analysisStatus": "failed"})
+        except Exception:
+            pass
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+
+class ProcessPoolAnalysisRunner(AnalysisRunner):
+    """Decodes in a ``ProcessPoolExecutor`` so ffmpeg/NumPy work never holds the GIL."""
+
+    def __init__(self, workers: int, queue_size: int):
+        super().__init__(workers, queue_size)
+        self._pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the parent holds gRPC threads from the Firestore client
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        # Concurrent jobs all see the same breakage; only the first replaces it
+        if self._pool is broken:
+            self._pool = self._new_pool()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, path: str) -> AudioAnalysis:
+        # A worker that dies (say, OOM-killed mid-decode) breaks the whole
+        # pool, so start a new one and give the job one more try
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self._pool
+            try:
+                return await loop.run_in_executor(pool, analyze_audio, path)
+            except BrokenProcessPool:
+                self._replace_pool(pool)
+                if attempt:
+                    raise
+
+    async def warm(self) -> None:
+        # Spawned workers start empty; one task each (roughly - the pool
+        # decides placement) has them import NumPy and pydub up front
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self._pool, warm_audio_stack) for _ in range(self.workers))
+        )
+
+    async def shutdown(self) -> None:
+        await super().shutdown()
+        # uvicorn re-raises SIGTERM once shutdown completes, which skips the
+        # executor's atexit join; wait (briefly) here so idle workers exit
+        # instead of being orphaned
+        try:
+            await asyncio.wait_for(
+                run_in_threadpool(self._pool.shutdown, wait=True, cancel_futures=True),
+                SHUTDOWN_WAIT_SECONDS,
+            )
+        except TimeoutError:
+            pass
+
+
+class LocalAnalysisRunner(AnalysisRunner):
+    """In-process backend for tests and local dev; job state lives only in memory."""
+
+    async def _run(self, path: str) -> AudioAnalysis:
+        return await run_in_threadpool(analyze_audio, path)
+
+
+async def _patch_media(band_id: str, media_id: str, fields: dict) -> None:
+    db = get_async_db()
+    ref = db.collection("bands").document(band_id).collection("media").document(media_id)
+    await ref.update(fields)
+
+
+_runner: AnalysisRunner | None = None
+
+
+def get_analysis_runner() -> AnalysisRunner:
+    global _runner
+    if _runner is None:
+        if settings.analysis_backend == "local":
+            cls = LocalAnalysisRunner
+        else:
+            cls = ProcessPoolAnalysisRunner
+        _runner = cls(settings.analysis_workers, settings.analysis_queue_size)
+    return _runner
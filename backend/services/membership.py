@@ -0,0 +1,67 @@
+"""Band membership lookups with a short-TTL in-process cache."""
+
+import asyncio
+import time
+
+from config import settings
+from services.firestore import get_async_db
+
+# band_id -> (uid -> role, expires_at)
+_cache: dict[str, tuple[dict[str, str], float]] = {}
+# Concurrent misses for the same band share one Firestore read
+_inflight: dict[str, asyncio.Future] = {}
+
+
+async def _fetch_roles(band_id: str) -> dict[str, str] | None:
+    doc = await get_async_db().collection("bands").document(band_id).get(field_paths=["members"])
+    if not doc.exists:
+        return None
+    members = (doc.to_dict() or {}).get("members", {})
+    return {uid: m.get("role", "member") for uid, m in members.items()}
+
+
+async def get_roles(band_id: str) -> dict[str, str] | None:
+    """Return ``uid -> role`` for the band, or None if the band doesn't exist."""
+    entry = _cache.get(band_id)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+
+    pending = _inflight.get(band_id)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # The leading request was cancelled, not this one: read it ourselves
+            if pending.cancelled() and not asyncio.current_task().cancelling():
+                return await get_roles(band_id)
+            raise
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[band_id] = future
+    try:
+        roles = await _fetch_roles(band_id)
+        future.set_result(roles)
+    except Exception as e:
+        future.set_exception(e)
+        # Nobody else may be waiting; mark the exception as retrieved
+        future.exception()
+        raise
+    finally:
+        # Cancelled (or some other BaseException): don't leave waiters hanging
+        if not future.done():
+            future.cancel()
+        _inflight.pop(band_id, None)
+
+    if roles is not None:
+        _cache[band_id] = (roles, time.monotonic() + settings.membership_cache_ttl_seconds)
+    return roles
+
+
+def set_roles(band_id: str, roles: dict[str, str]) -> None:
+    """Seed the cache after a write that already knows the full member map."""
+    _cache[band_id] = (roles, time.monotonic() + settings.membership_cache_ttl_seconds)
+
+
+def invalidate(band_id: str) -> None:
+    """Drop cached membership; call after any write to ``members``."""
+    _cache.pop(band_id, None)
@@ -0,0 +1,158 @@
+"""In-process request metrics: Prometheus text at /api/metrics, Server-Timing per response.
+
+Everything here is a no-op unless ``settings.metrics_enabled`` is set: the
+middleware isn't installed, the Firestore client isn't wrapped, and
+``observe`` returns straight away.
+
+Per-request timings live in a context variable set by
+``middleware.metrics.MetricsMiddleware``; code running outside a request
+(background analysis, cache rebuilds) only feeds the global histograms.
+"""
+
+import bisect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import settings
+
+ENABLED = settings.metrics_enabled
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self._series.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total[0]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+http_latency = Histogram(
+    "bandhub_http_request_duration_seconds",
+    "Request latency by route template",
+    ("method", "route", "status"),
+)
+firestore_latency = Histogram(
+    "bandhub_firestore_call_duration_seconds",
+    "Firestore RPC latency (streaming calls timed until fully read)",
+    ("method", "kind"),
+)
+firestore_per_request = Histogram(
+    "bandhub_firestore_calls_per_request",
+    "Firestore RPCs issued while serving one request",
+    ("route", "kind"),
+    COUNT_BUCKETS,
+)
+token_verify_latency = Histogram(
+    "bandhub_token_verify_duration_seconds",
+    "ID token verification, including token-cache hits",
+    ("cache",),
+)
+analysis_latency = Histogram(
+    "bandhub_audio_analysis_duration_seconds",
+    "Background audio analysis (decode, peaks, pyramid) per file",
+    ("status",),
+)
+HISTOGRAMS = [
+    http_latency,
+    firestore_latency,
+    firestore_per_request,
+    token_verify_latency,
+    analysis_latency,
+]
+
+
+class RequestTimings:
+    """Time spent per phase during one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # phase -> [count, seconds]
+        self.phases: dict[str, list] = defaultdict(lambda: [0, 0.0])
+
+    def add(self, phase: str, seconds: float) -> None:
+        entry = self.phases[phase]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def server_timing(self) -> str:
+        parts = [
+            f'{phase};desc="{count}x";dur={seconds * 1000:.1f}'
+            for phase, (count, seconds) in self.phases.items()
+        ]
+        parts.append(f"app;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def observe(
+    histogram: Histogram, seconds: float, *label_values: str, phase: str | None = None
+) -> None:
+    """Record ``seconds`` globally and, if given a ``phase``, against the current request."""
+    if not ENABLED:
+        return
+    histogram.observe(seconds, *label_values)
+    if phase is not None:
+        timings = current.get()
+        if timings is not None:
+            timings.add(phase, seconds)
+
+
+@contextmanager
+def timer(histogram: Histogram, *label_values: str, phase: str | None = None):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - start, *label_values, phase=phase)
+
+
+def render() -> str:
+    from auth import token_cache
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    stats = token_cache.stats()
+    lines += [
+        "# TYPE bandhub_token_cache_hits_total counter",
+        f"bandhub_token_cache_hits_total {stats['hits']}",
+        "# TYPE bandhub_token_cache_misses_total counter",
+        f"bandhub_token_cache_misses_total {stats['misses']}",
+        "# TYPE bandhub_token_cache_entries gauge",
+        f"bandhub_token_cache_entries {stats['size']}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,25 @@
+"""Opaque cursors for (value, doc id) ordered Firestore queries."""
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+
+def encode_cursor(value: datetime | str, doc_id: str) -> str:
+    # Timestamps round-trip as datetimes; anything else (e.g. ISO strings
+    # stored as text) is kept as-is
+    raw = {"t": value.isoformat()} if isinstance(value, datetime) else {"v": value}
+    raw["id"] = doc_id
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode("ascii")
+
+
+def decode_cursor(cursor: str, field: str) -> dict:
+    """Turn a cursor back into a ``start_after`` dict for ``order_by(field, "__name__")``."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        value = datetime.fromisoformat(raw["t"]) if "t" in raw else raw["v"]
+        return {field: value, "__name__": raw["id"]}
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,54 @@
+"""Firestore storage for peak pyramids, with a small in-process LRU."""
+
+from collections import OrderedDict
+
+from services.firestore import get_async_db
+from services.peaks import PeakPyramid
+
+# Decoded pyramids kept in memory; each is a few hundred KB at most
+CACHE_SIZE = 64
+
+_cache: OrderedDict[tuple[str, str], PeakPyramid] = OrderedDict()
+
+
+def _ref(band_id: str, media_id: str):
+    return (
+        get_async_db()
+        .collection("bands")
+        .document(band_id)
+        .collection("media")
+        .document(media_id)
+        .collection("derived")
+        .document("peaks")
+    )
+
+
+async def store_pyramid(band_id: str, media_id: str, pyramid: PeakPyramid) -> None:
+    """Write the pyramid blob next to (not inside) the media doc."""
+    await _ref(band_id, media_id).set({"pyramid": pyramid.to_bytes()})
+    _remember((band_id, media_id), pyramid)
+
+
+async def load_pyramid(band_id: str, media_id: str) -> PeakPyramid | None:
+    key = (band_id, media_id)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    doc = await _ref(band_id, media_id).get()
+    if not doc.exists:
+        return None
+    pyramid = PeakPyramid.from_bytes(doc.to_dict()["pyramid"])
+    _remember(key, pyramid)
+    return pyramid
+
+
+def forget_pyramid(band_id: str, media_id: str) -> None:
+    _cache.pop((band_id, media_id), None)
+
+
+def _remember(key: tuple[str, str], pyramid: PeakPyramid) -> None:
+    _cache[key] = pyramid
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
@@ -0,0 +1,173 @@
+"""Multi-resolution waveform peaks - min/max mipmaps stored as a compact blob."""
+
+import math
+import struct
+from dataclasses import dataclass, field
+
+import numpy as np
+
+PYRAMID_MAGIC = b"BHPY"
+PYRAMID_VERSION = 1
+
+PEAKS_MAGIC = b"BHPK"
+PEAKS_VERSION = 1
+# dtype codes in the BHPK header
+_PEAK_DTYPES = {1: np.dtype("u1"), 2: np.dtype("<u2"), 3: np.dtype("i1")}
+
+# Finest level is at least this many samples per pixel...
+MIN_SAMPLES_PER_PIXEL = 256
+# ...and has at most this many pixels, so the blob stays well under
+# Firestore's 1 MiB document limit (2 bytes/pixel, ~1.33x for all levels)
+MAX_BASE_PIXELS = 1 << 17
+# Each level is this many times coarser than the one below it
+LEVEL_FACTOR = 4
+# Stop adding levels once one fits in this many pixels
+MIN_LEVEL_PIXELS = 1024
+
+_HEADER = struct.Struct("<4sBBIQ")
+_LEVEL = struct.Struct("<II")
+_PEAKS_HEADER = struct.Struct("<4sBBBI")
+
+
+def encode_peaks(peaks, bits: int = 8) -> bytes:
+    """Quantize 0..1 overview peaks to a versioned BHPK blob.
+
+    Layout: magic, version, dtype code, values per point (1), point count,
+    then the little-endian unsigned values. 8 bits is plenty for drawing; 16
+    is there for callers that want to re-derive loudness from the overview.
+    """
+    code = 1 if bits == 8 else 2
+    dtype = _PEAK_DTYPES[code]
+    top = np.iinfo(dtype).max
+    values = np.clip(np.rint(np.asarray(peaks, dtype=np.float64) * top), 0, top).astype(dtype)
+    return _PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, code, 1, len(values)) + values.tobytes()
+
+
+def encode_pairs(pairs: np.ndarray) -> bytes:
+    """Wrap an ``(n, 2)`` int8 min/max array as a BHPK blob."""
+    return _PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, 3, 2, len(pairs)) + pairs.tobytes()
+
+
+def decode_peaks(blob: bytes) -> list[float]:
+    """Inverse of ``encode_peaks``: BHPK blob back to a list of 0..1 floats."""
+    magic, version, code, stride, count = _PEAKS_HEADER.unpack_from(blob)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION or stride != 1 or code not in (1, 2):
+        raise ValueError("Unsupported peaks format")
+    dtype = _PEAK_DTYPES[code]
+    values = np.frombuffer(blob, dtype=dtype, count=count, offset=_PEAKS_HEADER.size)
+    return (values / np.iinfo(dtype).max).round(4).tolist()
+
+
+def base_samples_per_pixel(frames: int) -> int:
+    """Power-of-two samples-per-pixel for the finest level of a ``frames`` long file."""
+    spp = max(MIN_SAMPLES_PER_PIXEL, math.ceil(frames / MAX_BASE_PIXELS))
+    return 1 << (spp - 1).bit_length()
+
+
+@dataclass
+class PeakPyramid:
+    """Min/max pairs at several samples-per-pixel levels, quantized to int8.
+
+    ``levels`` holds ``(samples_per_pixel, pairs)`` from finest to coarsest,
+    where ``pairs`` is an ``(n, 2)`` int8 array of (min, max) scaled so that
+    127 is the loudest sample in the file.
+    """
+
+    sample_rate: int
+    frames: int
+    levels: list[tuple[int, np.ndarray]] = field(default_factory=list)
+
+    @classmethod
+    def from_buckets(
+        cls,
+        mins: np.ndarray,
+        maxs: np.ndarray,
+        samples_per_pixel: int,
+        abs_max: float,
+        sample_rate: int,
+        frames: int,
+    ) -> "PeakPyramid":
+        """Build every level from the finest min/max buckets."""
+        scale = 127.0 / abs_max if abs_max > 0 else 0.0
+        pixels = math.ceil(frames / samples_per_pixel) if frames else 0
+        mins = np.asarray(mins[:pixels], dtype=np.float64)
+        maxs = np.asarray(maxs[:pixels], dtype=np.float64)
+
+        levels = []
+        spp = samples_per_pixel
+        while True:
+            pairs = np.stack([mins, maxs], axis=1) * scale
+            levels.append((spp, np.clip(np.rint(pairs), -127, 127).astype(np.int8)))
+            if len(mins) <= MIN_LEVEL_PIXELS:
+                break
+            pad = (-len(mins)) % LEVEL_FACTOR
+            mins = np.pad(mins, (0, pad)).reshape(-1, LEVEL_FACTOR).min(axis=1)
+            maxs = np.pad(maxs, (0, pad)).reshape(-1, LEVEL_FACTOR).max(axis=1)
+            spp *= LEVEL_FACTOR
+        return cls(sample_rate=sample_rate, frames=frames, levels=levels)
+
+    def to_bytes(self) -> bytes:
+        parts = [
+            _HEADER.pack(
+                PYRAMID_MAGIC, PYRAMID_VERSION, len(self.levels), self.sample_rate, self.frames
+            )
+        ]
+        for spp, pairs in self.levels:
+            parts.append(_LEVEL.pack(spp, len(pairs)))
+        for _, pairs in self.levels:
+            parts.append(pairs.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "PeakPyramid":
+        magic, version, count, sample_rate, frames = _HEADER.unpack_from(blob)
+        if magic != PYRAMID_MAGIC or version != PYRAMID_VERSION:
+            raise ValueError("Unsupported peak pyramid format")
+        offset = _HEADER.size
+        shapes = []
+        for _ in range(count):
+            shapes.append(_LEVEL.unpack_from(blob, offset))
+            offset += _LEVEL.size
+        levels = []
+        for spp, length in shapes:
+            pairs = np.frombuffer(blob, dtype=np.int8, count=length * 2, offset=offset)
+            levels.append((spp, pairs.reshape(length, 2)))
+            offset += length * 2
+        return cls(sample_rate=sample_rate, frames=frames, levels=levels)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    def window(self, start: float, end: float, width: int) -> tuple[float, np.ndarray]:
+        """Return ``(samples_per_pixel, pairs)`` for ``width`` pixels covering start..end seconds.
+
+        Reads from the coarsest level that still has at least one pixel per
+        output pixel, then reduces that slice to exactly ``width`` columns.
+        Pixels past the end of the file come back as (0, 0).
+        """
+        if not self.levels or end <= start or width <= 0:
+            return 0.0, np.zeros((max(width, 0), 2), dtype=np.int8)
+
+        wanted_spp = (end - start) * self.sample_rate / width
+        spp, pairs = self.levels[0]
+        for level_spp, level_pairs in self.levels:
+            if level_spp > wanted_spp:
+                break
+            spp, pairs = level_spp, level_pairs
+
+        # Column start offsets in source-level pixels; each column reduces up
+        # to the next column's start (or just its own pixel when zoomed in
+        # past the finest level)
+        edges = np.floor(
+            np.linspace(start, end, width, endpoint=False) * self.sample_rate / spp
+        ).astype(np.int64)
+        stop = min(math.ceil(end * self.sample_rate / spp), len(pairs))
+
+        out = np.zeros((width, 2), dtype=np.int8)
+        valid = (edges >= 0) & (edges < stop)
+        if valid.any():
+            data = pairs[:stop]
+            out[valid, 0] = np.minimum.reduceat(data[:, 0], edges[valid])
+            out[valid, 1] = np.maximum.reduceat(data[:, 1], edges[valid])
+        return wanted_spp, out
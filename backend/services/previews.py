@@ -0,0 +1,78 @@
+"""Low-bitrate preview transcodes for scrubbing long recordings on phones.
+
+Previews are keyed by the upload's content hash, so identical uploads (in
+any band) share one file, and live in a local ``DiskLRU`` capped at
+``settings.preview_cache_max_bytes``. They are produced next to analysis
+while the spooled upload is still on disk; an instance that never saw the
+upload has no preview and the client falls back to ``audio-url``.
+"""
+
+import subprocess
+import tempfile
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from services.disk_lru import DiskLRU
+
+# codec -> (file suffix, Content-Type, ffmpeg output arguments)
+FORMATS = {
+    # AAC in MP4 plays everywhere, including iOS Safari; faststart puts the
+    # index up front so range requests can seek before the whole file loads
+    "aac": (".m4a", "audio/mp4", ["-c:a", "aac", "-f", "mp4", "-movflags", "+faststart"]),
+    "opus": (".ogg", "audio/ogg", ["-c:a", "libopus", "-f", "ogg"]),
+}
+
+
+def preview_format() -> tuple[str, str, list[str]]:
+    return FORMATS.get(settings.preview_codec, FORMATS["aac"])
+
+
+_cache = DiskLRU(
+    settings.preview_cache_dir or Path(tempfile.gettempdir()) / "bandhub-previews",
+    settings.preview_cache_max_bytes,
+    suffix=preview_format()[0],
+)
+
+
+def transcode(source: str, dest: str | Path) -> None:
+    _, _, args = preview_format()
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y", "-i", source,
+            "-vn", "-ac", "2", "-b:a", settings.preview_bitrate,
+            *args, str(dest),
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+
+def _build(content_hash: str, source: str) -> None:
+    if _cache.path(content_hash) is not None:
+        return
+    tmp = _cache.temp_path()
+    try:
+        transcode(source, tmp)
+        _cache.put_file(content_hash, tmp)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+async def build_preview(content_hash: str, source: str) -> bool:
+    """Transcode ``source`` into the preview cache unless it's already there.
+
+    Returns False if the transcode failed (the upload is still usable).
+    """
+    if not settings.preview_enabled:
+        return False
+    try:
+        await run_in_threadpool(_build, content_hash, source)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+async def preview_path(content_hash: str) -> Path | None:
+    return await run_in_threadpool(_cache.path, content_hash)
@@ -0,0 +1,44 @@
+"""orjson-backed JSON responses.
+
+``FastJSONResponse`` is the app's default response class. Routes that
+return plain dicts still go through FastAPI's ``jsonable_encoder`` first;
+hot read endpoints return ``fast_json(...)`` instead, which skips that
+pass and lets orjson serialise Firestore values directly.
+"""
+
+from datetime import datetime
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    # orjson handles datetime natively but not subclasses such as
+    # Firestore's DatetimeWithNanoseconds
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def fast_json(content, response: Response | None = None) -> FastJSONResponse:
+    """Serialise ``content`` now, carrying over headers set on an injected ``Response``."""
+    result = FastJSONResponse(content)
+    if response is not None:
+        for key, value in response.headers.items():
+            if key != "content-length":
+                result.headers.append(key, value)
+        if response.status_code:
+            result.status_code = response.status_code
+    return result
@@ -0,0 +1,167 @@
+"""In-process audio similarity index for finding other takes of a song.
+
+Each analysed track carries a chroma fingerprint (see
+``services.features.ChromaFingerprint``) stored on the media doc as a small
+BHFP blob. A band's fingerprints are stacked into one matrix, so a lookup
+is a single matrix-vector product. Like the tag index, it is built lazily
+from a projected scan, kept current from this process's own writes and
+rebuilt after ``settings.similarity_index_ttl_seconds``.
+"""
+
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+from config import settings
+from services.firestore import get_async_db
+
+INDEX_FIELDS = ["fingerprint", "name"]
+
+FINGERPRINT_MAGIC = b"BHFP"
+FINGERPRINT_VERSION = 1
+# magic, version, value count
+_HEADER = struct.Struct("<4sBH")
+
+# How strongly the band's average fingerprint is subtracted. With only a
+# handful of tracks the average is mostly the tracks themselves, so it is
+# shrunk towards zero until the band has a few dozen.
+CENTERING_PRIOR = 8
+
+
+def encode_fingerprint(vector) -> bytes:
+    values = np.asarray(vector, dtype="<f2")
+    return _HEADER.pack(FINGERPRINT_MAGIC, FINGERPRINT_VERSION, len(values)) + values.tobytes()
+
+
+def decode_fingerprint(blob: bytes) -> np.ndarray:
+    magic, version, count = _HEADER.unpack_from(blob)
+    if magic != FINGERPRINT_MAGIC or version != FINGERPRINT_VERSION:
+        raise ValueError("Unsupported fingerprint format")
+    return np.frombuffer(blob, dtype="<f2", count=count, offset=_HEADER.size).astype(np.float32)
+
+
+class BandSimilarityIndex:
+    def __init__(self):
+        self.vectors: dict[str, np.ndarray] = {}
+        self.names: dict[str, str | None] = {}
+        self.built_at = time.monotonic()
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._matrix: np.ndarray | None = None
+
+    def put(self, media_id: str, data: dict) -> None:
+        """Insert or merge the indexed fields present in ``data``."""
+        if "name" in data:
+            self.names[media_id] = data["name"]
+        blob = data.get("fingerprint")
+        if blob is None:
+            return
+        try:
+            vector = decode_fingerprint(blob)
+        except (ValueError, struct.error):
+            return
+        # Fingerprints from an older extractor can't be compared with new ones
+        if self.vectors and len(vector) != len(next(iter(self.vectors.values()))):
+            return
+        self.vectors[media_id] = vector
+        self._matrix = None
+
+    def remove(self, media_id: str) -> None:
+        self.names.pop(media_id, None)
+        if self.vectors.pop(media_id, None) is not None:
+            self._matrix = None
+
+    def _build_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._ids = list(self.vectors)
+            self._rows = {media_id: i for i, media_id in enumerate(self._ids)}
+            matrix = np.stack([self.vectors[i] for i in self._ids])
+            # Remove what every track in the band shares (instrumentation,
+            # room, typical chord rhythm) so scores reflect the song itself
+            n = len(matrix)
+            matrix = matrix - matrix.mean(axis=0) * ((n - 1) / (n - 1 + CENTERING_PRIOR))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.maximum(norms, 1e-12)
+        return self._matrix
+
+    def nearest(
+        self, media_id: str, limit: int, min_score: float = -1.0
+    ) -> list[tuple[str, float]]:
+        """``(id, score)`` of the ``limit`` closest other tracks, best first.
+
+        Scores are cosine similarities in -1..1.
+        """
+        if media_id not in self.vectors:
+            return []
+        matrix = self._build_matrix()
+        scores = matrix @ matrix[self._rows[media_id]]
+        scores[self._rows[media_id]] = -np.inf
+        k = min(limit, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+_indexes: dict[str, BandSimilarityIndex] = {}
+_builds: dict[str, asyncio.Task] = {}
+
+
+async def _build(band_id: str) -> BandSimilarityIndex:
+    index = BandSimilarityIndex()
+    query = (
+        get_async_db()
+        .collection("bands")
+        .document(band_id)
+        .collection("media")
+        .select(INDEX_FIELDS)
+    )
+    async for doc in query.stream():
+        index.put(doc.id, doc.to_dict() or {})
+    _indexes[band_id] = index
+    return index
+
+
+def _start_build(band_id: str) -> asyncio.Task:
+    task = _builds.get(band_id)
+    if task is None:
+        task = _builds[band_id] = asyncio.create_task(_build(band_id))
+        task.add_done_callback(lambda t: _build_done(band_id, t))
+    return task
+
+
+def _build_done(band_id: str, task: asyncio.Task) -> None:
+    _builds.pop(band_id, None)
+    if not task.cancelled():
+        task.exception()
+
+
+async def get_index(band_id: str) -> BandSimilarityIndex:
+    """The band's index, building it on first use.
+
+    A stale index is still returned while a rebuild runs in the background,
+    so only the first lookup per band waits on the scan.
+    """
+    index = _indexes.get(band_id)
+    if index is None:
+        # shield: a cancelled request shouldn't cancel a build others await
+        return await asyncio.shield(_start_build(band_id))
+    if time.monotonic() - index.built_at >= settings.similarity_index_ttl_seconds:
+        _start_build(band_id)
+    return index
+
+
+def record_write(band_id: str, media_id: str, data: dict) -> None:
+    """Mirror a media create/update into the band's index, if one is loaded."""
+    index = _indexes.get(band_id)
+    if index is not None:
+        index.put(media_id, {k: v for k, v in data.items() if k in INDEX_FIELDS})
+
+
+def record_delete(band_id: str, media_id: str) -> None:
+    index = _indexes.get(band_id)
+    if index is not None:
+        index.remove(media_id)
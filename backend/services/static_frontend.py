@@ -0,0 +1,172 @@
+"""Serves the built frontend with precompressed variants and cache headers.
+
+The ``static/`` tree is indexed once at startup: each file gets a content
+hash for its ETag, and any ``.br`` / ``.gz`` siblings (written at build
+time by ``scripts/precompress.py``) are registered as encoded variants.
+Compressible files without a sibling are compressed on first request and
+kept in memory.
+
+Vite's fingerprinted output under ``assets/`` is served as immutable;
+everything else (``index.html``, the service worker, the manifest) must
+be revalidated. Paths that aren't files and don't look like one fall back
+to ``index.html`` so client-side routes survive a reload.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from middleware.compression import COMPRESSIBLE_TYPES, negotiate
+from services.http_cache import etag_matches
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Vite puts every content-hashed file under assets/; workbox runtimes are hashed too
+FINGERPRINTED = re.compile(r"^(assets/|workbox-[0-9a-f]{8}\.js$)")
+# Encoded siblings on disk, by Content-Encoding token
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# Smaller files aren't worth an encoded variant, nor is one that saves
+# less than 10%
+MIN_COMPRESS_BYTES = 1024
+MIN_SAVING = 0.9
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+mimetypes.add_type("text/javascript", ".js")
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def supported_encodings() -> list[str]:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+@dataclass
+class _Asset:
+    path: Path
+    size: int
+    media_type: str
+    digest: str
+    cache_control: str
+    # encoding -> file on disk, bytes compressed at runtime, or None if
+    # compressing didn't pay off
+    variants: dict[str, Path | bytes | None] = field(default_factory=dict)
+
+    @property
+    def compressible(self) -> bool:
+        return self.size >= MIN_COMPRESS_BYTES and self.media_type.startswith(COMPRESSIBLE_TYPES)
+
+    def etag(self, encoding: str | None) -> str:
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+class StaticFrontend:
+    """ASGI app for the built SPA; mount it at ``/`` after the API routes."""
+
+    def __init__(self, directory: str | Path, index: str = "index.html"):
+        self.directory = Path(directory)
+        self.index = index
+        self.assets: dict[str, _Asset] = {}
+        self._scan()
+
+    def _scan(self) -> None:
+        siblings = set(SUFFIXES.values())
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = Path(root) / name
+                if path.suffix in siblings:
+                    continue
+                rel = path.relative_to(self.directory).as_posix()
+                data = path.read_bytes()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if media_type.startswith("text/"):
+                    media_type += "; charset=utf-8"
+                asset = _Asset(
+                    path=path,
+                    size=len(data),
+                    media_type=media_type,
+                    digest=hashlib.sha256(data).hexdigest()[:20],
+                    cache_control=IMMUTABLE if FINGERPRINTED.match(rel) else REVALIDATE,
+                )
+                for encoding, suffix in SUFFIXES.items():
+                    encoded = path.with_name(name + suffix)
+                    if encoded.exists():
+                        asset.variants[encoding] = encoded
+                self.assets[rel] = asset
+
+    def _lookup(self, path: str, accept: str) -> _Asset | None:
+        rel = path.lstrip("/")
+        if rel in ("", self.index):
+            return self.assets.get(self.index)
+        asset = self.assets.get(rel)
+        if asset is not None:
+            return asset
+        if rel.endswith("/") and rel + self.index in self.assets:
+            return self.assets[rel + self.index]
+        # SPA fallback: client-side routes have no file extension (or are
+        # explicit HTML navigations); missing assets still 404
+        if rel.startswith("api/"):
+            return None
+        if "." not in rel.rsplit("/", 1)[-1] or "text/html" in accept:
+            return self.assets.get(self.index)
+        return None
+
+    async def _variant(self, asset: _Asset, accept_encoding: str) -> str | None:
+        if not asset.compressible:
+            return None
+        encoding = negotiate(accept_encoding, supported_encodings())
+        if encoding is None:
+            return None
+        if encoding not in asset.variants:
+            data = await run_in_threadpool(asset.path.read_bytes)
+            encoded = await run_in_threadpool(compress, data, encoding)
+            asset.variants[encoding] = encoded if len(encoded) < len(data) * MIN_SAVING else None
+        return encoding if asset.variants[encoding] is not None else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["method"] not in ("GET", "HEAD"):
+            await PlainTextResponse("Method Not Allowed", status_code=405)(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        asset = self._lookup(scope["path"], request_headers.get("accept", ""))
+        if asset is None:
+            await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+            return
+
+        encoding = await self._variant(asset, request_headers.get("accept-encoding", ""))
+        headers = {"ETag": asset.etag(encoding), "Cache-Control": asset.cache_control}
+        if asset.compressible:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+            await Response(status_code=304, headers=headers)(scope, receive, send)
+            return
+
+        body = asset.variants.get(encoding) if encoding else asset.path
+        if isinstance(body, bytes):
+            response = Response(body, media_type=asset.media_type, headers=headers)
+            if scope["method"] == "HEAD":
+                response.body = b""
+        else:
+            response = FileResponse(body, media_type=asset.media_type, headers=headers)
+        await response(scope, receive, send)
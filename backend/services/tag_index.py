@@ -0,0 +1,154 @@
+"""In-process inverted tag index for multi-tag AND media filters.
+
+Firestore takes one ``array_contains`` per query, so ``tags=a,b`` with
+``match=all`` is the one library filter it can't answer directly.
+
+Each band's index maps tag -> media ids and keeps the few fields list
+filters need (tags, project, type, uploadedAt). It is built lazily from a
+projected scan of the band's media, kept current from this process's own
+writes, and rebuilt after ``settings.tag_index_ttl_seconds`` to pick up
+writes made elsewhere (e.g. the frontend writing Firestore directly).
+Until then it can miss or wrongly include docs, so callers treat its
+matches as candidates and re-check the docs they fetch.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from config import settings
+from services.firestore import get_async_db
+
+INDEX_FIELDS = ["tags", "project", "type", "uploadedAt"]
+
+
+@dataclass
+class _Entry:
+    tags: frozenset[str]
+    project: str | None
+    type: str | None
+    uploaded_at: datetime | None
+
+
+class BandTagIndex:
+    def __init__(self):
+        self.entries: dict[str, _Entry] = {}
+        self.by_tag: dict[str, set[str]] = defaultdict(set)
+        self.built_at = time.monotonic()
+
+    def put(self, media_id: str, data: dict) -> None:
+        """Insert or merge the indexed fields present in ``data``."""
+        old = self.entries.get(media_id)
+        entry = _Entry(
+            tags=frozenset(data["tags"]) if "tags" in data else (old.tags if old else frozenset()),
+            project=data["project"] if "project" in data else (old.project if old else None),
+            type=data["type"] if "type" in data else (old.type if old else None),
+            uploaded_at=(
+                data["uploadedAt"] if "uploadedAt" in data else (old.uploaded_at if old else None)
+            ),
+        )
+        if old is not None:
+            for tag in old.tags - entry.tags:
+                self._untag(tag, media_id)
+        for tag in entry.tags:
+            self.by_tag[tag].add(media_id)
+        self.entries[media_id] = entry
+
+    def remove(self, media_id: str) -> None:
+        entry = self.entries.pop(media_id, None)
+        if entry is not None:
+            for tag in entry.tags:
+                self._untag(tag, media_id)
+
+    def _untag(self, tag: str, media_id: str) -> None:
+        ids = self.by_tag.get(tag)
+        if ids is not None:
+            ids.discard(media_id)
+            if not ids:
+                del self.by_tag[tag]
+
+    def match(
+        self,
+        tags: list[str],
+        match_all: bool = True,
+        project: str | None = None,
+        type: str | None = None,
+    ) -> list[tuple[datetime, str]]:
+        """``(uploadedAt, id)`` of matching media, newest first."""
+        if tags:
+            # Intersect smallest-first so AND queries touch as few ids as possible
+            sets = sorted((self.by_tag.get(t, set()) for t in tags), key=len)
+            ids = set.intersection(*sets) if match_all else set().union(*sets)
+        else:
+            ids = self.entries.keys()
+
+        hits = []
+        for media_id in ids:
+            entry = self.entries[media_id]
+            # Firestore's uploadedAt ordering skips docs without the field; so do we
+            if entry.uploaded_at is None:
+                continue
+            if project is not None and entry.project != project:
+                continue
+            if type is not None and entry.type != type:
+                continue
+            hits.append((entry.uploaded_at, media_id))
+        hits.sort(reverse=True)
+        return hits
+
+
+_indexes: dict[str, BandTagIndex] = {}
+_builds: dict[str, asyncio.Task] = {}
+
+
+async def _build(band_id: str) -> None:
+    index = BandTagIndex()
+    query = (
+        get_async_db()
+        .collection("bands")
+        .document(band_id)
+        .collection("media")
+        .select(INDEX_FIELDS)
+    )
+    async for doc in query.stream():
+        index.put(doc.id, doc.to_dict() or {})
+    _indexes[band_id] = index
+
+
+def get_index(band_id: str) -> BandTagIndex | None:
+    """The band's index if it is built and fresh; otherwise start a build and return None."""
+    index = _indexes.get(band_id)
+    if index is not None and time.monotonic() - index.built_at < settings.tag_index_ttl_seconds:
+        return index
+    if band_id not in _builds:
+        task = asyncio.create_task(_build(band_id))
+        _builds[band_id] = task
+        task.add_done_callback(lambda t: _build_done(band_id, t))
+    return None
+
+
+def _build_done(band_id: str, task: asyncio.Task) -> None:
+    _builds.pop(band_id, None)
+    # A failed build just means the next request falls back to Firestore again
+    if not task.cancelled():
+        task.exception()
+
+
+def record_write(band_id: str, media_id: str, data: dict) -> None:
+    """Mirror a media create/update into the band's index, if one is loaded."""
+    index = _indexes.get(band_id)
+    if index is None:
+        return
+    fields = {k: v for k, v in data.items() if k in INDEX_FIELDS}
+    if "uploadedAt" in fields and not isinstance(fields["uploadedAt"], datetime):
+        # SERVER_TIMESTAMP sentinel; "now" is close enough for ordering
+        fields["uploadedAt"] = datetime.now(timezone.utc)
+    index.put(media_id, fields)
+
+
+def record_delete(band_id: str, media_id: str) -> None:
+    index = _indexes.get(band_id)
+    if index is not None:
+        index.remove(media_id)
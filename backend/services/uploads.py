@@ -0,0 +1,48 @@
+"""Streaming upload helpers - spool request bodies to disk in fixed-size chunks."""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class SpooledUpload:
+    """An upload written to a temporary file, with its size and SHA-256."""
+
+    path: str
+    size: int
+    sha256: str
+
+    def cleanup(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file: UploadFile, chunk_size: int = CHUNK_SIZE) -> SpooledUpload:
+    """Copy an ``UploadFile`` to a named temp file without holding it in memory.
+
+    Size and content hash are computed as the chunks go by. The caller owns
+    the returned file and must call ``cleanup()`` once done with it.
+    """
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="bandhub-upload-", suffix=suffix)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(chunk_size):
+                digest.update(chunk)
+                size += len(chunk)
+                await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return SpooledUpload(path=path, size=size, sha256=digest.hexdigest())
@@ -0,0 +1,50 @@
+import shutil
+import wave
+
+import numpy as np
+import pytest
+
+from services import audio
+
+
+def _noise(frames: int, channels: int) -> np.ndarray:
+    rng = np.random.default_rng(7)
+    samples = rng.normal(0, 4000, (frames, channels))
+    # A loud spot near the end, so the tail matters
+    samples[frames - 500] = 30000
+    return samples.clip(-32768, 32767).astype(np.int16)
+
+
+def _write_wav(path, samples: np.ndarray, sample_rate: int = 44100) -> None:
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(samples.shape[1])
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(samples.tobytes())
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_streaming_peaks_match_in_memory(tmp_path):
+    path = tmp_path / "take.wav"
+    _write_wav(path, _noise(123_457, 2))
+
+    streamed = audio.analyze_audio_streaming(str(path))
+    loaded = audio.analyze_audio_memory(str(path))
+
+    assert streamed.frames == loaded.frames
+    np.testing.assert_allclose(streamed.peaks, loaded.peaks, atol=1e-6)
+
+
+def test_streaming_buckets_like_reduce_peaks(monkeypatch):
+    samples = _noise(123_457, 2)
+    floats = samples.astype(np.float32) / 32768
+
+    def stream_pcm(path, channels, block_frames=audio.STREAM_BLOCK_FRAMES, mono=True):
+        for start in range(0, len(floats), 10_000):
+            yield floats[start : start + 10_000]
+
+    monkeypatch.setattr(audio, "probe_audio", lambda path: (44100, 2, len(samples)))
+    monkeypatch.setattr(audio, "stream_pcm", stream_pcm)
+
+    expected = audio.reduce_peaks(samples.mean(axis=1))
+    np.testing.assert_allclose(audio.analyze_audio_streaming("take.wav").peaks, expected, atol=1e-6)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from services.features import SpectralFeatures
+
+SAMPLE_RATE = 22050
+SECONDS = 20
+
+
+def _bpm(signal: np.ndarray) -> float | None:
+    spectral = SpectralFeatures(SAMPLE_RATE)
+    for start in range(0, len(signal), 1 << 16):
+        spectral.update(signal[start : start + (1 << 16)].astype(np.float32))
+    return spectral.bpm()
+
+
+def test_steady_tone_has_no_tempo():
+    t = np.arange(SAMPLE_RATE * SECONDS) / SAMPLE_RATE
+    assert _bpm(0.5 * np.sin(2 * np.pi * 440 * t)) is None
+
+
+def test_click_track_tempo():
+    rng = np.random.default_rng(3)
+    signal = np.zeros(SAMPLE_RATE * SECONDS)
+    for start in range(0, len(signal) - 1000, SAMPLE_RATE // 2):
+        signal[start : start + 1000] = rng.normal(0, 0.5, 1000) * np.exp(-np.arange(1000) / 150)
+    assert abs(_bpm(signal) - 120) < 2
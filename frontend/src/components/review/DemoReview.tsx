@@ -12,12 +12,14 @@ import {
   serverTimestamp,
   orderBy,
   query,
+  type Bytes,
 } from "firebase/firestore";
 import { db, DEMO_MODE } from "../../firebase";
 import { useAuth } from "../../hooks/useAuth";
 import { useBand } from "../../hooks/useBand";
 import { useOfflineStorage, getOfflineUrl } from "../../hooks/useOfflineStorage";
 import { getMediaBlob, getPublicMediaBlob, getDirectDriveUrl } from "../../utils/storage";
+import { mediaPeaks } from "../../utils/peaks";
 import { WaveformPlayer, type CommentMarkerData } from "./WaveformPlayer";
 import { CommentPanel } from "./CommentPanel";
 import { AddCommentModal } from "./AddCommentModal";
@@ -41,6 +43,7 @@ interface MediaDoc {
   mimeType?: string;
   duration?: number;
   peaks?: number[];
+  peaksData?: Bytes;      // compact peaks from backend analysis; see mediaPeaks
   driveFileId?: string;
   gcsPath?: string;       // migration fallback for old uploads
   downloadUrl?: string;   // migration fallback for old uploads
@@ -96,7 +99,7 @@ export function DemoReview() {
         return;
       }
       const data = snap.data() as MediaDoc;
-      setMedia(data);
+      setMedia({ ...data, peaks: mediaPeaks(data) });
       setLyrics(data.lyrics ?? "");
       setSongInfo(data.songInfo ?? {});
 
@@ -0,0 +1,37 @@
+import type { Bytes } from "firebase/firestore";
+
+// BHPK overview blob written by the backend (services/peaks.py encode_peaks):
+// "BHPK", version, dtype code, values per point, little-endian point count
+const PEAKS_MAGIC = "BHPK";
+const PEAKS_VERSION = 1;
+const HEADER_SIZE = 11;
+// dtype code -> [bytes per value, max value]
+const PEAK_DTYPES: Record<number, [number, number]> = { 1: [1, 0xff], 2: [2, 0xffff] };
+
+/** Decode a BHPK overview blob to 0..1 peaks, or undefined if it isn't one */
+export function decodePeaks(blob: Uint8Array): number[] | undefined {
+  if (blob.length < HEADER_SIZE) return undefined;
+  const view = new DataView(blob.buffer, blob.byteOffset, blob.byteLength);
+  const magic = String.fromCharCode(...blob.subarray(0, 4));
+  const dtype = PEAK_DTYPES[view.getUint8(5)];
+  if (magic !== PEAKS_MAGIC || view.getUint8(4) !== PEAKS_VERSION || view.getUint8(6) !== 1 || !dtype) {
+    return undefined;
+  }
+  const [width, top] = dtype;
+  const count = view.getUint32(7, true);
+  if (blob.length < HEADER_SIZE + count * width) return undefined;
+
+  const peaks: number[] = [];
+  for (let i = 0; i < count; i++) {
+    const offset = HEADER_SIZE + i * width;
+    const value = width === 1 ? view.getUint8(offset) : view.getUint16(offset, true);
+    peaks.push(value / top);
+  }
+  return peaks;
+}
+
+/** Waveform peaks for a media doc: the compact peaksData blob, else the float
+ *  list on older docs and client-side uploads */
+export function mediaPeaks(media: { peaksData?: Bytes; peaks?: number[] }): number[] | undefined {
+  return (media.peaksData && decodePeaks(media.peaksData.toUint8Array())) || media.peaks;
+}